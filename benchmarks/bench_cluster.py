@@ -0,0 +1,119 @@
+# 分布式模式的单机测试和基准：在一台机器上启动协调器和若干个本地工作节点，与本机批量模式比较，并检查结果
+#
+# 语料与 bench_suite.py 相同（每种格式和分辨率各一个章节，打包成ZIP）。两个用例：
+#   batch    batch-zip -j <节点数 x 每个节点的进程数>，本机的进程池
+#   cluster  batch-zip --serve 启动协调器，再启动 --nodes 个 worker 进程（每个 -j <每个节点的进程数>），模拟多台机器
+# --kill-after 秒数：在这之后用 kill -9 杀掉第一个工作节点，检查它的章节在租约过期后由其他节点重试完成
+#
+# 两个用例都必须成功转换全部章节，且每个章节的页数一致，否则以非零状态退出。
+# 本地的工作节点共用本机的CPU（每个节点都按整台机器选择页面线程数），cluster 的耗时反映的是协议和调度的开销，
+# 而不是多台机器带来的加速。
+#
+# 用法：
+#   python benchmarks/bench_cluster.py [--nodes 3] [--node-workers 1] [--pages 12] [--kill-after 2]
+
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'img_2_pdf_2.py')
+BENCH_SUITE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_suite.py')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def load_report(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# 本机批量模式
+def run_batch(zips, output, workers, report_path):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, SCRIPT, '-q', 'batch-zip', *zips, '-o', output, '-j', str(workers),
+                    '--report', report_path], check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start, load_report(report_path)
+
+
+# 分布式模式：协调器和工作节点都是本机的独立进程；kill_after 不为None时在这之后杀掉第一个工作节点
+def run_cluster(zips, output, nodes, node_workers, report_path, lease_seconds, kill_after):
+    port = free_port()
+    start = time.perf_counter()
+    coordinator = subprocess.Popen([sys.executable, SCRIPT, '-q', 'batch-zip', *zips, '-o', output,
+                                    '--serve', f"127.0.0.1:{port}", '--lease-seconds', str(lease_seconds),
+                                    '--report', report_path], stdout=subprocess.DEVNULL)
+    workers = [subprocess.Popen([sys.executable, SCRIPT, '-q', 'worker', f"127.0.0.1:{port}",
+                                 '-j', str(node_workers), '--name', f"node{i + 1}"], stdout=subprocess.DEVNULL)
+               for i in range(nodes)]
+    if kill_after is not None:
+        time.sleep(kill_after)
+        workers[0].send_signal(signal.SIGKILL)
+    code = coordinator.wait()
+    elapsed = time.perf_counter() - start
+    for worker in workers:
+        worker.wait()
+    if code:
+        sys.exit(f"协调器以状态 {code} 退出")
+    return elapsed, load_report(report_path)
+
+
+def pages_by_output(report):
+    return {os.path.basename(job['output']): job.get('counters', {}).get('pages') for job in report['jobs']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分布式模式的单机测试和基准")
+    parser.add_argument('--nodes', type=int, default=3, help="本地工作节点数")
+    parser.add_argument('--node-workers', type=int, default=1, help="每个工作节点的工作进程数")
+    parser.add_argument('--pages', type=int, default=12, help="每个章节的页数")
+    parser.add_argument('--lease-seconds', type=float, default=3.0, help="协调器的租约时长（秒）")
+    parser.add_argument('--kill-after', type=float, default=None, metavar='SECONDS',
+                        help="在这之后杀掉第一个工作节点，检查它的章节由其他节点重试完成")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        out = subprocess.run([sys.executable, BENCH_SUITE, '--make-corpus', work, str(args.pages)],
+                             check=True, capture_output=True, text=True).stdout
+        zips = [zip_path for _, _, zip_path in json.loads(out)]
+
+        batch_seconds, batch = run_batch(zips, os.path.join(work, 'batch'), args.nodes * args.node_workers,
+                                         os.path.join(work, 'batch.json'))
+        cluster_seconds, cluster = run_cluster(zips, os.path.join(work, 'cluster'), args.nodes, args.node_workers,
+                                               os.path.join(work, 'cluster.json'), args.lease_seconds,
+                                               args.kill_after)
+
+    pages = batch['counters']['pages']
+    print(f"{'case':>8} {'chapters':>9} {'pages':>6} {'seconds':>8} {'pages/s':>8}")
+    for case, seconds, report in (('batch', batch_seconds, batch), ('cluster', cluster_seconds, cluster)):
+        print(f"{case:>8} {report['succeeded']:>9} {report['counters']['pages']:>6} {seconds:>8.2f} "
+              f"{report['counters']['pages'] / seconds:>8.1f}")
+    for job in cluster['jobs']:
+        print(f"  {os.path.basename(job['source']):>16} {job['worker']:>8} 第 {job['attempts']} 次尝试")
+
+    failures = []
+    if batch['succeeded'] != len(zips) or cluster['succeeded'] != len(zips):
+        failures.append(f"成功转换的章节数：batch {batch['succeeded']}，cluster {cluster['succeeded']}，共 {len(zips)} 个")
+    if pages_by_output(batch) != pages_by_output(cluster):
+        failures.append(f"各章节的页数不一致：{pages_by_output(batch)} / {pages_by_output(cluster)}")
+    if args.kill_after is not None and not any(job['attempts'] > 1 for job in cluster['jobs']):
+        failures.append("杀掉工作节点后没有章节被重试（节点可能在领到章节之前就被杀掉了）")
+    for line in failures:
+        print(f"FAIL {line}")
+    if failures:
+        sys.exit(1)
+    print(f"分布式模式的结果与本机批量模式一致（{pages} 页）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# 峰值内存基准：比较流式写入与旧的 Pillow save_all 写法
+#
+#   legacy    旧写法：全部解码后一次性 save_all
+#   reencode  流式写入，JPEG 也解码后重新编码
+#   streaming 流式写入，JPEG 原样嵌入（默认路径）
+#
+# 用法：
+#   python benchmarks/bench_memory.py [--pages 10 50 100 200] [--size 1600x2400]
+#
+# 每个用例都在独立的子进程中运行，读取子进程自身的峰值RSS（ru_maxrss），
+# 因此各用例之间互不影响。仅支持提供 resource 模块的系统（Linux / macOS）。
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# 生成一个包含N张随机噪点JPEG的章节文件夹（噪点让JPEG体积接近真实扫描图）
+# 每页使用新的噪点，各页内容都不相同，否则重复页面去重会让每个章节只编码一张图片
+def make_corpus(folder, pages, size):
+    from PIL import Image
+    os.makedirs(folder, exist_ok=True)
+    page = Image.new('RGB', size)
+    for i in range(pages):
+        tile = Image.effect_noise((256, 256), 64).convert('RGB')
+        for x in range(0, size[0], 256):
+            for y in range(0, size[1], 256):
+                page.paste(tile, (x, y))
+        page.save(os.path.join(folder, f"{i + 1:04d}.jpg"), quality=90)
+
+
+# 读取当前进程的峰值RSS（MB）
+def peak_rss_mb():
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为KB，macOS 为字节
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+# 旧写法：先把所有页面解码进列表，再一次性交给 Pillow 保存
+def legacy_images_to_pdf(image_folder, output_pdf):
+    from PIL import Image
+    from img_2_pdf_2 import is_image_file, natural_sort_key
+    files = sorted((f for f in os.listdir(image_folder) if is_image_file(f)), key=natural_sort_key)
+    images = [Image.open(os.path.join(image_folder, f)).convert('RGB') for f in files]
+    images[0].save(output_pdf, save_all=True, append_images=images[1:])
+
+
+# 子进程入口：运行一个用例并以JSON输出结果
+def run_child(mode, folder, output_pdf):
+    from img_2_pdf_2 import images_to_pdf
+    start = time.perf_counter()
+    if mode == 'legacy':
+        legacy_images_to_pdf(folder, output_pdf)
+    elif mode == 'reencode':
+        images_to_pdf(folder, output_pdf, jpeg_passthrough=False)
+    else:
+        images_to_pdf(folder, output_pdf)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        'mode': mode,
+        'seconds': elapsed,
+        'peak_rss_mb': peak_rss_mb(),
+        'output_mb': os.path.getsize(output_pdf) / (1024 * 1024),
+    }))
+
+
+def run_case(mode, folder, output_pdf):
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', mode, folder, output_pdf],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="images_to_pdf 峰值内存基准")
+    parser.add_argument('--pages', type=int, nargs='+', default=[10, 50, 100, 200])
+    parser.add_argument('--size', default='1600x2400', help="页面尺寸，格式为 宽x高")
+    parser.add_argument('--child', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+
+    size = tuple(int(v) for v in args.size.lower().split('x'))
+    print(f"{'pages':>6} {'mode':>10} {'peak RSS MB':>12} {'seconds':>9} {'output MB':>10}")
+    with tempfile.TemporaryDirectory() as work:
+        for pages in args.pages:
+            folder = os.path.join(work, f"chapter_{pages}")
+            make_corpus(folder, pages, size)
+            for mode in ('legacy', 'reencode', 'streaming'):
+                result = run_case(mode, folder, os.path.join(work, f"{mode}_{pages}.pdf"))
+                print(f"{pages:>6} {mode:>10} {result['peak_rss_mb']:>12.1f} "
+                      f"{result['seconds']:>9.2f} {result['output_mb']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# PDF合并基准：比较流式合并与旧的 PyPDF2 PdfMerger 写法的峰值内存和吞吐量
+#
+#   merger    旧写法：所有输入 append 到同一个 PdfMerger，最后一次性 write
+#   streaming 流式合并（merge_pdfs 的默认路径）
+#
+# 用法：
+#   python benchmarks/bench_merge.py [--volumes 5 20] [--pages 40] [--size 1600x2400]
+#
+# 输入PDF由 images_to_pdf 从噪点JPEG生成；每个用例在独立的子进程中运行，读取子进程自身的峰值RSS。
+# 各分卷是同一个PDF的硬链接，流式合并关闭跨文件去重（dedupe=False），与 PdfMerger 一样复制全部页面。
+# 吞吐量按输入PDF的总大小除以耗时计算。
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_memory import make_corpus, peak_rss_mb
+
+
+# 旧写法：PdfMerger 把所有输入的对象树保留在内存中，直到最后写出
+def merger_merge_pdfs(pdf_files, output_pdf):
+    from PyPDF2 import PdfMerger
+    merger = PdfMerger()
+    for pdf in pdf_files:
+        merger.append(pdf)
+    with open(output_pdf, 'wb') as fp:
+        merger.write(fp)
+    merger.close()
+
+
+# 生成 volumes 个内容相同的分卷PDF，返回文件列表
+def make_volumes(work, volumes, pages, size):
+    from img_2_pdf_2 import images_to_pdf
+    folder = os.path.join(work, f"pages_{pages}")
+    source = os.path.join(work, f"volume_{pages}.pdf")
+    if not os.path.exists(source):
+        make_corpus(folder, pages, size)
+        images_to_pdf(folder, source)
+    pdf_files = []
+    for i in range(volumes):
+        path = os.path.join(work, f"volume_{pages}_{i + 1:03d}.pdf")
+        if not os.path.exists(path):
+            os.link(source, path)
+        pdf_files.append(path)
+    return pdf_files
+
+
+# 子进程入口：运行一个用例并以JSON输出结果
+def run_child(mode, output_pdf, pdf_files):
+    from img_2_pdf_2 import merge_pdfs
+    start = time.perf_counter()
+    if mode == 'merger':
+        merger_merge_pdfs(pdf_files, output_pdf)
+    else:
+        merge_pdfs(pdf_files, output_pdf, dedupe=False)
+    elapsed = time.perf_counter() - start
+    input_mb = sum(os.path.getsize(p) for p in pdf_files) / (1024 * 1024)
+    print(json.dumps({
+        'mode': mode,
+        'seconds': elapsed,
+        'peak_rss_mb': peak_rss_mb(),
+        'input_mb': input_mb,
+        'mb_per_second': input_mb / elapsed if elapsed else 0.0,
+    }))
+
+
+def run_case(mode, output_pdf, pdf_files):
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', mode, output_pdf, *pdf_files],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="merge_pdfs 峰值内存和吞吐量基准")
+    parser.add_argument('--volumes', type=int, nargs='+', default=[5, 20])
+    parser.add_argument('--pages', type=int, default=40, help="每个分卷的页数")
+    parser.add_argument('--size', default='1600x2400', help="页面尺寸，格式为 宽x高")
+    parser.add_argument('--child', nargs='+', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        mode, output_pdf, *pdf_files = args.child
+        run_child(mode, output_pdf, pdf_files)
+        return
+
+    size = tuple(int(v) for v in args.size.lower().split('x'))
+    print(f"{'volumes':>8} {'mode':>10} {'input MB':>9} {'peak RSS MB':>12} {'seconds':>9} {'MB/s':>8}")
+    with tempfile.TemporaryDirectory() as work:
+        for volumes in args.volumes:
+            pdf_files = make_volumes(work, volumes, args.pages, size)
+            for mode in ('merger', 'streaming'):
+                output_pdf = os.path.join(work, f"{mode}_{volumes}.pdf")
+                result = run_case(mode, output_pdf, pdf_files)
+                os.remove(output_pdf)
+                print(f"{volumes:>8} {mode:>10} {result['input_mb']:>9.1f} {result['peak_rss_mb']:>12.1f} "
+                      f"{result['seconds']:>9.2f} {result['mb_per_second']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
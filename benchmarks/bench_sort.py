@@ -0,0 +1,109 @@
+# 页面排序的测试语料和速度基准
+#
+# CASES 中每一组文件名都按期望的顺序列出；脚本把每组打乱若干次后用 natural_sort_key 排序，
+# 检查结果是否与期望一致，然后比较 natural_sort_key 与旧的 extract_number（只取第一个数字）
+# 对大量文件名排序的耗时。有任何一组排序错误时以非零状态退出。
+#
+# 用法：
+#   python benchmarks/bench_sort.py [--names 100000]
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from img_2_pdf_2 import natural_sort_key
+
+
+CASES = [
+    ("简单数字", [
+        "1.jpg", "2.jpg", "10.jpg", "11.jpg", "100.jpg",
+    ]),
+    ("零填充与不填充混用", [
+        "001.jpg", "2.jpg", "03.jpg", "10.jpg", "011.jpg",
+    ]),
+    ("多个数字：卷、话、页", [
+        "vol1_ch9_p001.jpg", "vol1_ch9_p002.jpg", "vol1_ch10_p001.jpg",
+        "vol2_ch9_p001.jpg", "vol2_ch10_p003.jpg", "vol2_ch10_p010.jpg",
+    ]),
+    ("复制产生的 (1) 后缀", [
+        "Chapter 1.png", "Chapter 1 (1).png", "Chapter 1 (2).png", "Chapter 1 (10).png", "Chapter 2.png",
+    ]),
+    ("文字部分按字母顺序比较", [
+        "cover.jpg", "p1.jpg", "p2.jpg", "p10.jpg",
+    ]),
+    ("中日文与数字混排", [
+        "第1话_01.jpg", "第1话_02.jpg", "第2话_01.jpg", "第10话_01.jpg", "第10话_02.jpg",
+    ]),
+    ("全角数字", [
+        "ページ１.jpg", "ページ２.jpg", "ページ10.jpg", "ページ１１.jpg",
+    ]),
+    ("大小写不影响顺序", [
+        "Page1.jpg", "page2.JPG", "PAGE3.jpg", "page10.jpg",
+    ]),
+    ("数值相同的写法按原名稳定排序", [
+        "01.jpg", "1.jpg", "1.png",
+    ]),
+    ("ZIP中的嵌套文件夹：先按文件夹，同一文件夹中的文件在子文件夹之前", [
+        "cover.jpg", "ch1/1.jpg", "ch1/2.jpg", "ch1/10.jpg", "ch1/extra/1.jpg",
+        "ch2/1.jpg", "ch10/1.jpg", "ch10/2.jpg",
+    ]),
+    ("文件夹名中的多个数字", [
+        "Vol.1 Ch.9/001.jpg", "Vol.1 Ch.10/001.jpg", "Vol.2 Ch.1/001.jpg",
+    ]),
+]
+
+
+# 旧的排序键：只取文件名中的第一个数字
+def extract_number(filename):
+    numbers = re.findall(r'\d+', filename)
+    return int(numbers[0]) if numbers else 0
+
+
+def check_cases(shuffles=20):
+    failures = 0
+    rng = random.Random(0)
+    for title, expected in CASES:
+        for _ in range(shuffles):
+            names = expected[:]
+            rng.shuffle(names)
+            result = sorted(names, key=natural_sort_key)
+            if result != expected:
+                failures += 1
+                print(f"FAIL {title}\n  期望: {expected}\n  实际: {result}")
+                break
+        else:
+            print(f"ok   {title}")
+    return failures
+
+
+def make_names(count):
+    rng = random.Random(1)
+    return [f"vol{rng.randint(1, 30)}_ch{rng.randint(1, 300)}_p{rng.randint(1, 60):03d}.jpg" for _ in range(count)]
+
+
+def time_sort(names, key):
+    start = time.perf_counter()
+    sorted(names, key=key)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="页面自然排序的测试语料和速度基准")
+    parser.add_argument('--names', type=int, default=100000, help="速度基准中排序的文件名数量")
+    args = parser.parse_args()
+
+    failures = check_cases()
+    names = make_names(args.names)
+    print(f"{'key':>18} {'seconds':>9}  ({args.names} names)")
+    print(f"{'extract_number':>18} {time_sort(names, extract_number):>9.3f}")
+    print(f"{'natural_sort_key':>18} {time_sort(names, natural_sort_key):>9.3f}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+# 回归基准：用离线生成的合成漫画语料测量各个模式的吞吐量、每页延迟、峰值内存和输出大小，并与保存的基线比较
+#
+# 语料按固定随机种子生成，每次运行完全相同：
+#   每种格式（JPEG / PNG / WEBP）和每种分辨率各一个章节文件夹，章节中黑白页和彩色页交替出现，
+#   另外把每个章节打包成一个ZIP（存储，不压缩）
+#
+# 用例：
+#   folder:<章节>  单文件夹模式
+#   zip:<章节>     ZIP文件模式
+#   batch          批量文件夹模式（所有章节，多进程）
+#   merge          把所有章节的PDF合并为一个
+#
+# 每个用例都通过命令行在独立的子进程中运行，结果取自 --report 写出的运行报告；重复 --repeat 次，
+# 耗时和峰值内存取中位数，单次运行受机器负载影响的波动不会直接变成退化。
+# 与基线相比吞吐量下降、峰值内存增加、输出变大超过容差，或者页数变化、解码（打开）的图片数增加、
+# JPEG原样嵌入的页数减少时，打印 REGRESSION 并以非零状态退出。
+#
+# 用法：
+#   python benchmarks/bench_suite.py --update-baseline  在本机记录基线（改动之前运行，或性能有意变化之后重新记录）
+#   python benchmarks/bench_suite.py                    与 benchmarks/baseline.json 比较
+#
+# 吞吐量和内存与机器有关，基线只在记录它的机器上有效，因此不随代码提交（见 benchmarks/.gitignore）：
+# 基线记录了机器信息（平台、CPU架构和核心数、Python版本），与当前机器不一致时拒绝比较，需要先在本机重新记录基线。
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'img_2_pdf_2.py')
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+FORMATS = ('jpg', 'png', 'webp')
+RESOLUTIONS = {'small': (960, 1440), 'large': (1800, 2700)}
+
+# 各指标允许的变化幅度：耗时取 --repeat 次的中位数后仍有波动（很快的用例另有绝对余量），输出大小是确定的
+SPEED_TOLERANCE = 0.30
+SPEED_SLACK_SECONDS = 0.05
+MEMORY_TOLERANCE = 0.25
+MEMORY_SLACK_MB = 8
+SIZE_TOLERANCE = 0.02
+
+
+# 画一张合成的漫画页面：分格边框、人物轮廓、对白框和网点，彩色页面的格子里有色块
+def make_page(size, color, seed):
+    from PIL import Image, ImageDraw
+    rng = random.Random(seed)
+    width, height = size
+    page = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(page)
+    margin = width // 20
+    rows = rng.randint(2, 4)
+    row_height = (height - 2 * margin) // rows
+    line = max(2, width // 300)
+    for row in range(rows):
+        top = margin + row * row_height
+        split = rng.randint(width // 3, width * 2 // 3)
+        for left, right in ((margin, split - margin // 4), (split + margin // 4, width - margin)):
+            bottom = top + row_height - margin // 2
+            if color:
+                fill = tuple(rng.randint(120, 255) for _ in range(3))
+                draw.rectangle((left, top, right, bottom), fill=fill)
+            # 网点：在格子的一部分区域画规则的小圆点
+            step = max(4, width // 160)
+            for y in range(top + (bottom - top) // 2, bottom, step):
+                for x in range(left, left + (right - left) // 3, step):
+                    draw.ellipse((x, y, x + step // 2, y + step // 2), fill='black')
+            for _ in range(rng.randint(3, 8)):
+                x0, y0 = rng.randint(left, right), rng.randint(top, bottom)
+                x1, y1 = rng.randint(left, right), rng.randint(top, bottom)
+                draw.line((x0, y0, x1, y1), fill='black', width=line)
+            cx, cy = rng.randint(left, right), rng.randint(top, bottom)
+            r = (right - left) // 6
+            draw.ellipse((cx - r, cy - r, cx + r, cy + r), outline='black', width=line)
+            bx, by = left + (right - left) // 8, top + (bottom - top) // 8
+            draw.rounded_rectangle((bx, by, bx + (right - left) // 3, by + (bottom - top) // 4),
+                                   radius=r // 3, fill='white', outline='black', width=line)
+            draw.rectangle((left, top, right, bottom), outline='black', width=line * 2)
+    return page if color else page.convert('L')
+
+
+# 生成语料：返回 [(章节名, 文件夹, ZIP)]；文件夹放在 work/chapters 下，ZIP放在 work/zips 下
+def make_corpus(work, pages):
+    chapters = []
+    for resolution, size in RESOLUTIONS.items():
+        for fmt in FORMATS:
+            name = f"{fmt}_{resolution}"
+            folder = os.path.join(work, 'chapters', name)
+            os.makedirs(folder, exist_ok=True)
+            for i in range(pages):
+                page = make_page(size, color=i % 2 == 1, seed=f"{name}/{i}")
+                options = {'quality': 85} if fmt == 'jpg' else {'quality': 80} if fmt == 'webp' else {}
+                page.save(os.path.join(folder, f"{i + 1:03d}.{fmt}"), **options)
+            zip_path = os.path.join(work, 'zips', f"{name}.zip")
+            os.makedirs(os.path.dirname(zip_path), exist_ok=True)
+            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as zf:
+                for filename in sorted(os.listdir(folder)):
+                    zf.write(os.path.join(folder, filename), filename)
+            chapters.append((name, folder, zip_path))
+    return chapters
+
+
+# 通过命令行运行一次，返回运行报告
+def run_cli(args, report_path):
+    subprocess.run([sys.executable, SCRIPT, '-q', *args, '--report', report_path],
+                   check=True, stdout=subprocess.DEVNULL)
+    with open(report_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# 从运行报告中取出比较用的指标
+def case_metrics(report, output_bytes):
+    counters = report['counters']
+    pages, wall = counters['pages'], report['wall_seconds']
+    peak = max(report.get('peak_rss_mb') or 0, report.get('worker_peak_rss_mb') or 0)
+    return {
+        'pages': pages,
+        'seconds': round(wall, 4),
+        'pages_per_second': round(pages / wall, 2),
+        'mb_per_second': round(counters['bytes_in'] / 2**20 / wall, 2),
+        'ms_per_page': round(wall / pages * 1000, 2),
+        'peak_rss_mb': round(peak, 1),
+        'output_bytes': output_bytes,
+        'image_opens': report['stages'].get('decode', {}).get('calls', 0),
+        'passthrough_pages': counters.get('passthrough_pages', 0),
+    }
+
+
+# 定义全部用例：{用例名: (命令行参数, 输出文件或文件夹)}
+def build_cases(work, chapters):
+    out = os.path.join(work, 'out')
+    os.makedirs(out, exist_ok=True)
+    cases = {}
+    for name, folder, zip_path in chapters:
+        cases[f"folder:{name}"] = (['folder', folder, os.path.join(out, f"folder_{name}.pdf")],
+                                   os.path.join(out, f"folder_{name}.pdf"))
+        cases[f"zip:{name}"] = (['zip', zip_path, os.path.join(out, f"zip_{name}.pdf")],
+                                os.path.join(out, f"zip_{name}.pdf"))
+    batch_out = os.path.join(out, 'batch')
+    cases['batch'] = (['batch-folder', os.path.join(work, 'chapters'), '-o', batch_out], batch_out)
+    merge_inputs = [os.path.join(out, f"folder_{name}.pdf") for name, _, _ in chapters]
+    cases['merge'] = (['merge', *merge_inputs, '-o', os.path.join(out, 'merged.pdf')],
+                      os.path.join(out, 'merged.pdf'))
+    return cases
+
+
+def output_size(path):
+    if os.path.isdir(path):
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.name.endswith('.pdf'))
+    return os.path.getsize(path)
+
+
+def run_suite(pages, repeat):
+    results = {}
+    with tempfile.TemporaryDirectory() as work:
+        # 语料在子进程中生成：Linux 上子进程的 ru_maxrss 从父进程继承，父进程需要保持很小的内存占用
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), '--make-corpus', work, str(pages)],
+                             check=True, capture_output=True, text=True).stdout
+        chapters = json.loads(out)
+        # merge 用例依赖 folder 用例的输出，字典按插入顺序运行
+        for case, (args, output) in build_cases(work, chapters).items():
+            runs = []
+            for run in range(repeat):
+                report = run_cli(args, os.path.join(work, f"report_{run}.json"))
+                runs.append(case_metrics(report, output_size(output)))
+            # 取耗时居中的一次运行，峰值内存单独取中位数
+            runs.sort(key=lambda metrics: metrics['seconds'])
+            best = dict(runs[len(runs) // 2],
+                        peak_rss_mb=sorted(metrics['peak_rss_mb'] for metrics in runs)[len(runs) // 2])
+            results[case] = best
+            print(f"{case:>18} {best['pages']:>6} {best['pages_per_second']:>9.1f} {best['mb_per_second']:>8.1f} "
+                  f"{best['ms_per_page']:>9.1f} {best['peak_rss_mb']:>10.1f} {best['output_bytes'] / 2**20:>10.2f}")
+    return results
+
+
+# 与基线逐项比较，返回发现的退化列表
+def compare(results, baseline):
+    regressions = []
+    for case, base in baseline['cases'].items():
+        current = results.get(case)
+        if current is None:
+            regressions.append(f"{case}: 用例缺失")
+            continue
+        if current['pages'] != base['pages']:
+            regressions.append(f"{case}: 页数 {base['pages']} -> {current['pages']}")
+        if current['output_bytes'] > base['output_bytes'] * (1 + SIZE_TOLERANCE):
+            regressions.append(f"{case}: 输出大小 {base['output_bytes']} -> {current['output_bytes']} 字节")
+        if 'image_opens' in base and current['image_opens'] > base['image_opens']:
+            regressions.append(f"{case}: 解码的图片数 {base['image_opens']} -> {current['image_opens']}")
+        if 'passthrough_pages' in base and current['passthrough_pages'] < base['passthrough_pages']:
+            regressions.append(f"{case}: 原样嵌入的页数 {base['passthrough_pages']} -> {current['passthrough_pages']}")
+        if current['seconds'] > base['seconds'] * (1 + SPEED_TOLERANCE) + SPEED_SLACK_SECONDS:
+            regressions.append(f"{case}: 耗时 {base['seconds']} -> {current['seconds']} 秒"
+                               f"（{base['pages_per_second']} -> {current['pages_per_second']} 页/秒）")
+        if current['peak_rss_mb'] > base['peak_rss_mb'] * (1 + MEMORY_TOLERANCE) + MEMORY_SLACK_MB:
+            regressions.append(f"{case}: 峰值内存 {base['peak_rss_mb']} -> {current['peak_rss_mb']} MB")
+    return regressions
+
+
+def machine_info():
+    return {'platform': platform.platform(), 'machine': platform.machine(), 'python': platform.python_version(),
+            'cpus': os.cpu_count()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成漫画语料上的回归基准")
+    parser.add_argument('--pages', type=int, default=12, help="每个章节的页数")
+    parser.add_argument('--repeat', type=int, default=5, help="每个用例的运行次数，耗时和峰值内存取中位数")
+    parser.add_argument('--baseline', default=BASELINE, help="基线文件")
+    parser.add_argument('--update-baseline', action='store_true', help="把本次结果保存为新的基线")
+    parser.add_argument('--make-corpus', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.make_corpus:
+        work, pages = args.make_corpus
+        print(json.dumps(make_corpus(work, int(pages))))
+        return
+
+    baseline = None
+    if not args.update_baseline:
+        try:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        except OSError:
+            sys.exit(f"没有找到基线文件 {args.baseline}，请先用 --update-baseline 记录基线")
+        if baseline['pages'] != args.pages:
+            sys.exit(f"基线按每章 {baseline['pages']} 页记录，与 --pages {args.pages} 不一致")
+        if baseline['machine'] != machine_info():
+            sys.exit(f"基线记录于不同的机器 {baseline['machine']}（本机 {machine_info()}），"
+                     f"吞吐量和内存无法比较；请先在本机用 --update-baseline 重新记录基线")
+
+    print(f"{'case':>18} {'pages':>6} {'pages/s':>9} {'MB/s':>8} {'ms/page':>9} {'peak RSS MB':>10} {'output MB':>10}")
+    results = run_suite(args.pages, args.repeat)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'pages': args.pages, 'machine': machine_info(), 'cases': results}, f, indent=1)
+            f.write('\n')
+        print(f"基线已保存到 {args.baseline}")
+        return
+
+    regressions = compare(results, baseline)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if regressions:
+        sys.exit(1)
+    print("与基线相比没有退化")
+
+
+if __name__ == '__main__':
+    main()
@@ -8,67 +8,860 @@
 # pip install pillow
 # pip install tkinter (Python 3.x 通常已预装)
 # pip install PyPDF2
+#
+# 不带参数运行时打开图形界面；也可以在命令行中使用，例如：
+# python img_2_pdf_2.py batch-zip *.zip -o 输出文件夹
+# 多台机器共享存储时，可以用 --serve 启动协调器、在每台机器上运行 worker 命令，把章节分给各台机器转换
+# 运行 python img_2_pdf_2.py --help 查看全部命令
 
 
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
-from PIL import Image
+# tkinter 和 PyPDF2 只在用到时才导入：命令行模式和工作进程不需要GUI，也可以在没有显示器的服务器上运行
+# 分布式模式用到的网络模块（http.server、urllib、socket 等）同样只在协调器和工作节点中导入
+from PIL import Image, ImageChops, features
+import argparse
+import contextlib
+import glob
+import hashlib
+import importlib.util
+import io
+import json
+import math
+import mmap
+import multiprocessing
 import os
+import queue
 import re
-import zipfile
+import signal
+import sys
 import tempfile
-import shutil
+import zipfile
+import zlib
 import threading
-from PyPDF2 import PdfMerger
+import time
+import unicodedata
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+# 重新编码页面时使用的JPEG质量（与Pillow PDF插件的默认值一致）
+JPEG_QUALITY = 75
+
+# 灰度检测：在不超过 GRAY_SAMPLE_SIZE 见方的缩小副本上计算每个像素的色度（RGB通道间的最大差值），
+# 色度不低于 GRAY_CHROMA_THRESHOLD 的像素比例不超过 GRAY_MAX_COLOR_RATIO 时按灰度页面保存
+GRAY_SAMPLE_SIZE = 128
+GRAY_CHROMA_THRESHOLD = 24
+GRAY_MAX_COLOR_RATIO = 0.005
+
+# 线稿检测：灰度在 [BITONAL_BLACK_LEVEL, BITONAL_WHITE_LEVEL) 之间的中间调像素比例
+# 不超过 BITONAL_MAX_MIDTONE_RATIO 时按1位黑白页面保存
+BITONAL_SAMPLE_SIZE = 256
+BITONAL_BLACK_LEVEL = 48
+BITONAL_WHITE_LEVEL = 208
+BITONAL_MAX_MIDTONE_RATIO = 0.03
+
+# 感知哈希的边长：把页面缩成 (N+1) x N 的灰度图，比较相邻像素得到 N*N 位的差值哈希
+PERCEPTUAL_HASH_SIZE = 16
+
+# 条漫切割：默认的页面高宽比；高度超过一页加 STRIP_TAIL 页的图片才切割，最后一页也允许长出这么多，避免切出很窄的碎片
+# 每个切割点在目标位置之前 STRIP_CUT_WINDOW 页高的范围内寻找留白：先把条漫缩成 STRIP_SCAN_COLUMNS 列宽的灰度图，
+# 行内平均偏差不超过 STRIP_GUTTER_THRESHOLD 的行算作留白，取离目标位置最近的一行；找不到留白时取最均匀的一行
+# 缩小时每次只处理 STRIP_SCAN_BAND 行高的横条，不生成整条图的转换副本
+STRIP_PAGE_ASPECT = 1.5
+STRIP_TAIL = 0.25
+STRIP_CUT_WINDOW = 0.3
+STRIP_SCAN_COLUMNS = 64
+STRIP_SCAN_BAND = 1024
+STRIP_GUTTER_THRESHOLD = 2
+
+# 预扫描时读取图片文件头的字节数：先读 HEADER_PROBE_BYTES，解析不出尺寸时（如JPEG前面有很大的EXIF）
+# 再读 HEADER_PROBE_MAX_BYTES，仍然不够时才读取整个文件
+HEADER_PROBE_BYTES = 4 * 1024
+HEADER_PROBE_MAX_BYTES = 256 * 1024
+
+# 图形界面刷新进度的频率（次/秒）；工作线程只更新最新进度，界面按这个频率读取
+PROGRESS_POLL_HZ = 20
+
+# 单个章节内并行解码/编码页面的线程数（None 表示使用全部CPU核心，1 表示逐页顺序处理）
+PAGE_WORKERS = None
+
+# 每个页面线程最多预先准备的页数；已准备但尚未写入的页面总数不超过 线程数 x 该值
+PAGE_QUEUE_DEPTH_PER_WORKER = 2
+
+# 批量模式同时转换的章节数（None 表示使用全部CPU核心）
+BATCH_WORKERS = None
+
+# 批量模式所有工作进程合计的内存预算（字节，None 表示物理内存的一半）
+BATCH_MEMORY_BUDGET = None
+
+# 增量批量转换时保存在输出文件夹中的清单文件名
+MANIFEST_NAME = '.img_2_pdf_manifest.json'
+
+# 批量转换的断点日志文件名：记录本次批量任务中已完成的章节，用于崩溃或取消后继续
+JOURNAL_NAME = '.img_2_pdf_journal.jsonl'
 
-# 提取文件名中的数字
-def extract_number(filename):
-    numbers = re.findall(r'\d+', filename)
-    return int(numbers[0]) if numbers else 0
+# 监视模式的持久化队列文件名：已确认写完、等待转换或正在转换的章节，重启后继续处理
+QUEUE_NAME = '.img_2_pdf_queue.json'
+
+# 监视模式：扫描输入文件夹的间隔（秒）；章节的大小和修改时间保持不变多久（秒）才认为已经写完；
+# 计算延迟统计时保留最近完成的章节数
+WATCH_INTERVAL = 1.0
+WATCH_SETTLE_SECONDS = 3.0
+WATCH_METRICS_WINDOW = 1000
+
+# 监视模式：工作进程意外退出（如被OOM killer杀掉）时正在转换的章节重新排队，每个章节最多尝试的次数
+WATCH_MAX_ATTEMPTS = 3
+
+# 分布式模式：协调器的默认端口；租约时长（秒），工作节点每隔租约的三分之一发送一次心跳续租，
+# 超过租约时长没有续租的章节（节点崩溃或断网）交给其他节点重试；每个章节最多尝试的次数；
+# 空闲的工作节点向协调器申请新章节的间隔（秒）；工作节点每个HTTP请求的超时（秒）
+CLUSTER_PORT = 8765
+CLUSTER_LEASE_SECONDS = 30.0
+CLUSTER_MAX_ATTEMPTS = 3
+CLUSTER_POLL_INTERVAL = 1.0
+CLUSTER_REQUEST_TIMEOUT = 10.0
+
+# 协调器监听回环地址以外的地址却没有设置令牌时的错误信息
+CLUSTER_TOKEN_REQUIRED = "协调器监听本机以外的地址时必须用 --token 指定共享令牌"
+
+# 估算任务内存时使用的参数：每个工作进程的基础开销；已知图片尺寸时，解码一页时每个像素占用的字节数
+# （原始模式的像素最多4字节，加上转换后的RGB副本3字节）；尺寸未知时，按解码后相对文件大小的膨胀倍数估算
+WORKER_BASE_MEMORY = 64 * 1024 * 1024
+DECODED_BYTES_PER_PIXEL = 7
+DECODE_EXPANSION = 12
+
+# 自然排序：把名称拆成交替的文字段和数字段，数字段按数值比较
+_NATURAL_CHUNKS = re.compile(r'(\d+)')
+
+# 一个名称（不含路径）的自然排序键：(文字, 数字, 文字, 数字, ..., 文字)
+# 先做NFKC规范化（全角数字、全角字母转为半角）并忽略大小写；拆分结果总是以文字段开始并交替出现，
+# 因此同一位置上比较的总是同类型的值
+def _natural_chunks(name):
+    name = name.lower() if name.isascii() else unicodedata.normalize('NFKC', name).casefold()
+    chunks = _NATURAL_CHUNKS.split(name)
+    chunks[1::2] = [int(chunk) for chunk in chunks[1::2]]
+    return tuple(chunks)
+
+# 文件路径的自然排序键，可用于 sorted(key=...)（sorted 对每个元素只计算一次键）
+# - 文件名中的所有数字都参与比较：vol2_ch9_p001 排在 vol2_ch10_p003 前面
+# - 先比较去掉扩展名的部分：Chapter 1.png 排在 Chapter 1 (1).png 前面
+# - 路径按 '/' 分段（ZIP成员路径），先按所在文件夹逐级比较，同一文件夹中的文件排在子文件夹之前
+# - 数值相同的零填充写法（01 和 1）、大小写不同或扩展名不同时，最后按原始路径比较，结果与列出顺序无关
+def natural_sort_key(path):
+    *folders, name = path.replace('\\', '/').split('/')
+    stem, ext = os.path.splitext(name)
+    return (tuple(_natural_chunks(folder) for folder in folders), _natural_chunks(stem), _natural_chunks(ext), path)
 
 # 检查文件是否为图片
 def is_image_file(filename):
     return filename.lower().endswith(('.png', '.jpg', '.jpeg', '.webp', '.gif', '.bmp'))
 
-# 从ZIP文件中提取图片
-def extract_images_from_zip(zip_file, progress_callback=None):
-    temp_dir = tempfile.mkdtemp()
+# PDF中的间接引用（序列化为 "N 0 R"）
+PdfRef = namedtuple('PdfRef', ['num'])
+
+# PDF文本字符串（序列化为UTF-16BE十六进制串，可以安全地包含中文）
+PdfText = namedtuple('PdfText', ['text'])
+
+# 已经是PDF语法的字节，原样写出（用于从其他PDF复制过来的数字、字符串等）
+PdfRaw = namedtuple('PdfRaw', ['data'])
+
+# 书签：dest 是目标数组（如 [页面引用, 'Fit']），children 是子书签列表
+PdfOutline = namedtuple('PdfOutline', ['title', 'dest', 'children'])
+
+# 已编码、可直接写入PDF的页面图像
+PdfImage = namedtuple('PdfImage', ['width', 'height', 'color_space', 'bits', 'filter', 'data', 'decode_parms'])
+
+_PDF_NAME_SAFE = set(range(33, 127)) - set(b'#%/()<>[]{}')
+
+# 序列化PDF名称：dict的键和str值都按名称处理
+def _pdf_name(name):
+    out = bytearray(b'/')
+    for c in name.encode('utf-8'):
+        if c in _PDF_NAME_SAFE:
+            out.append(c)
+        else:
+            out.extend(b'#%02X' % c)
+    return bytes(out)
+
+# 把Python对象序列化为PDF语法
+def pdf_serialize(value):
+    if value is None:
+        return b'null'
+    if value is True:
+        return b'true'
+    if value is False:
+        return b'false'
+    if isinstance(value, PdfRef):
+        return b'%d 0 R' % value.num
+    if isinstance(value, PdfRaw):
+        return value.data
+    if isinstance(value, PdfText):
+        return b'<FEFF' + value.text.encode('utf-16-be').hex().upper().encode('ascii') + b'>'
+    if isinstance(value, int):
+        return b'%d' % value
+    if isinstance(value, float):
+        text = ('%.4f' % value).rstrip('0').rstrip('.')
+        return (text if text not in ('', '-0') else '0').encode('ascii')
+    if isinstance(value, str):
+        return _pdf_name(value)
+    if isinstance(value, (bytes, bytearray)):
+        return b'<' + bytes(value).hex().upper().encode('ascii') + b'>'
+    if isinstance(value, dict):
+        return b'<<' + b''.join(_pdf_name(k) + b' ' + pdf_serialize(v)
+                                for k, v in value.items() if v is not None) + b'>>'
+    if isinstance(value, (list, tuple)):
+        return b'[' + b' '.join(pdf_serialize(v) for v in value) + b']'
+    raise TypeError(f"无法序列化为PDF对象: {value!r}")
+
+# 流式PDF写入器：每个对象写完立即落盘，只在内存中保留xref偏移和页面引用
+class PdfStreamWriter:
+    def __init__(self, fp, title=None):
+        self.fp = fp
+        self.pos = 0
+        self.offsets = {}
+        self.next_num = 1
+        self.page_refs = []
+        self.outlines = []
+        self.title = title
+        self.pages_ref = self.alloc()
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _write(self, data):
+        self.fp.write(data)
+        self.pos += len(data)
+
+    # 预留一个对象编号
+    def alloc(self):
+        ref = PdfRef(self.next_num)
+        self.next_num += 1
+        return ref
+
+    # 写出一个间接对象；stream不为None时写成流对象
+    def write_obj(self, ref, obj, stream=None):
+        self.offsets[ref.num] = self.pos
+        if stream is not None:
+            obj = dict(obj, Length=len(stream))
+        self._write(b'%d 0 obj\n' % ref.num + pdf_serialize(obj))
+        if stream is not None:
+            self._write(b'\nstream\n')
+            self._write(stream)
+            self._write(b'\nendstream')
+        self._write(b'\nendobj\n')
+        return ref
+
+    # 写出一个页面对象，Parent由写入器补全；ref 为预留的对象编号（其他对象需要提前引用该页面时使用）
+    def add_page(self, page, ref=None):
+        ref = ref or self.alloc()
+        self.write_obj(ref, dict(page, Type='Page', Parent=self.pages_ref))
+        self.page_refs.append(ref)
+        return ref
+
+    # 写出图像XObject，返回其引用；同一图像可以被多个页面共用
+    def add_image(self, image):
+        return self.write_obj(self.alloc(), {
+            'Type': 'XObject',
+            'Subtype': 'Image',
+            'Width': image.width,
+            'Height': image.height,
+            'ColorSpace': image.color_space,
+            'BitsPerComponent': image.bits,
+            'Filter': image.filter,
+            'DecodeParms': image.decode_parms,
+        }, stream=image.data)
     
+    # 写出单图页面，页面尺寸按72dpi换算；image_ref 是已经写出的同一图像（重复页面共用），为None时先写出图像
+    def add_image_page(self, image, image_ref=None):
+        image_ref = image_ref or self.add_image(image)
+        content = b'q %d 0 0 %d 0 0 cm /Im0 Do Q\n' % (image.width, image.height)
+        content_ref = self.write_obj(self.alloc(), {}, stream=content)
+        procset = 'ImageC' if image.color_space != 'DeviceGray' else 'ImageB'
+        return self.add_page({
+            'MediaBox': [0, 0, image.width, image.height],
+            'Resources': {'ProcSet': ['PDF', procset], 'XObject': {'Im0': image_ref}},
+            'Contents': content_ref,
+        })
+
+    # 写出同一层级的书签，返回它们的对象引用；有子书签的项默认折叠
+    # prev_ref 是这一层级中排在新书签前面的已有书签（追加到已有PDF时使用）
+    def _write_outline_items(self, items, parent_ref, prev_ref=None):
+        refs = [self.alloc() for _ in items]
+        for i, (item, ref) in enumerate(zip(items, refs)):
+            child_refs = self._write_outline_items(item.children, ref) if item.children else None
+            self.write_obj(ref, {
+                'Title': PdfText(item.title),
+                'Parent': parent_ref,
+                'Prev': refs[i - 1] if i > 0 else prev_ref,
+                'Next': refs[i + 1] if i + 1 < len(refs) else None,
+                'First': child_refs[0] if child_refs else None,
+                'Last': child_refs[-1] if child_refs else None,
+                'Count': -len(child_refs) if child_refs else None,
+                'Dest': item.dest,
+            })
+        return refs
+    
+    # 写出页面树、书签、目录、xref表和trailer
+    def close(self):
+        self.write_obj(self.pages_ref, {'Type': 'Pages', 'Kids': self.page_refs, 'Count': len(self.page_refs)})
+        outlines_ref = None
+        if self.outlines:
+            outlines_ref = self.alloc()
+            refs = self._write_outline_items(self.outlines, outlines_ref)
+            self.write_obj(outlines_ref, {'Type': 'Outlines', 'First': refs[0], 'Last': refs[-1], 'Count': len(refs)})
+        root_ref = self.write_obj(self.alloc(), {
+            'Type': 'Catalog',
+            'Pages': self.pages_ref,
+            'Outlines': outlines_ref,
+            'PageMode': 'UseOutlines' if outlines_ref else None,
+        })
+        trailer = {'Size': self.next_num, 'Root': root_ref}
+        if self.title:
+            trailer['Info'] = self.write_obj(self.alloc(), {'Title': PdfText(self.title), 'Producer': PdfText('img_2_pdf_2')})
+            trailer['Size'] = self.next_num
+        xref_pos = self.pos
+        lines = [b'xref\n0 %d\n' % self.next_num, b'0000000000 65535 f \n']
+        for num in range(1, self.next_num):
+            if num in self.offsets:
+                lines.append(b'%010d 00000 n \n' % self.offsets[num])
+            else:
+                lines.append(b'0000000000 00000 f \n')
+        self._write(b''.join(lines))
+        self._write(b'trailer\n' + pdf_serialize(trailer) + b'\nstartxref\n%d\n%%%%EOF\n' % xref_pos)
+
+# 进程的峰值内存（RSS，MB）；children=True 时为已结束的子进程中最大的峰值；不支持的平台（Windows）返回None
+def peak_rss_mb(children=False):
     try:
-        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
-            # 获取所有文件列表
-            file_list = zip_ref.namelist()
-            
-            # 检查是否包含图片文件
-            has_images = any(is_image_file(file) for file in file_list)
-            
-            if not has_images:
-                shutil.rmtree(temp_dir)
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # Linux 以KB为单位，macOS 以字节为单位
+    return usage.ru_maxrss / (2**20 if sys.platform == 'darwin' else 1024)
+
+# 一次运行（一个章节、一次合并或一个批量任务）的统计：各阶段的墙钟时间和CPU时间、页数、读入和写出的字节数
+# stage 可以在多个线程中同时使用，各阶段的时间是所有线程的合计（CPU时间按线程计算），所以可能超过总的墙钟时间
+# report() 返回可以直接写成JSON的运行报告
+class RunStats:
+    def __init__(self, **info):
+        self.info = info
+        self.stages = {}    # 阶段名 -> [墙钟秒数, CPU秒数, 次数]
+        self.counters = {'pages': 0, 'bytes_in': 0, 'bytes_out': 0}
+        self._lock = threading.Lock()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            with self._lock:
+                entry = self.stages.setdefault(name, [0.0, 0.0, 0])
+                entry[0] += wall
+                entry[1] += cpu
+                entry[2] += 1
+
+    def add(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    # 把另一次运行的报告（例如工作进程中一个章节的报告）的阶段时间和计数累加进来
+    def add_report(self, report):
+        with self._lock:
+            for name, stage in report.get('stages', {}).items():
+                entry = self.stages.setdefault(name, [0.0, 0.0, 0])
+                entry[0] += stage['wall_seconds']
+                entry[1] += stage['cpu_seconds']
+                entry[2] += stage['calls']
+            for counter, value in report.get('counters', {}).items():
+                self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def report(self, **info):
+        wall = time.perf_counter() - self._wall_start
+        with self._lock:
+            counters = dict(self.counters)
+            stages = {name: {'wall_seconds': round(w, 6), 'cpu_seconds': round(c, 6), 'calls': n}
+                      for name, (w, c, n) in self.stages.items()}
+        return dict(self.info, **info,
+                    wall_seconds=round(wall, 6),
+                    cpu_seconds=round(time.process_time() - self._cpu_start, 6),
+                    pages_per_second=round(counters['pages'] / wall, 3) if wall > 0 else None,
+                    peak_rss_mb=peak_rss_mb(),
+                    counters=counters,
+                    stages=stages)
+
+# 不需要统计时使用的空实现
+class _NoStats:
+    def stage(self, name):
+        return contextlib.nullcontext()
+
+    def add(self, counter, amount=1):
+        pass
+
+NO_STATS = _NoStats()
+
+# 把运行报告写成JSON文件：先写临时文件再替换
+def write_run_report(path, report):
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    os.replace(path + '.tmp', path)
+
+# 可以原样嵌入PDF（DCTDecode）的JPEG帧类型：基线、扩展顺序、渐进式
+# 无损、算术编码和分层JPEG不在此列，需要解码后重新编码
+_PASSTHROUGH_SOF = {0xC0, 0xC1, 0xC2}
+_JPEG_COLOR_SPACES = {1: 'DeviceGray', 3: 'DeviceRGB'}
+
+# 只解析JPEG文件头，返回 (宽, 高, PDF颜色空间)；不能直接嵌入时返回None
+def read_jpeg_header(data):
+    if data[:3] != b'\xff\xd8\xff':
+        return None
+    pos = 2
+    size = len(data)
+    while pos + 4 <= size:
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:  # 填充字节
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # 没有长度字段的标记
+            pos += 2
+            continue
+        if marker in (0xD9, 0xDA):  # 在帧头之前就遇到图像数据或结束标记
+            return None
+        length = int.from_bytes(data[pos + 2:pos + 4], 'big')
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            if marker not in _PASSTHROUGH_SOF or pos + 10 > size:
                 return None
-            
-            # 提取所有文件到临时目录
-            if progress_callback:
-                progress_callback(0, f"正在提取ZIP文件: {os.path.basename(zip_file)}")
-            
-            total_files = len(file_list)
-            for i, file in enumerate(file_list):
-                zip_ref.extract(file, temp_dir)
-                if progress_callback and i % max(1, total_files // 10) == 0:  # 每10%更新一次
-                    progress = (i + 1) / total_files * 100
-                    progress_callback(progress, f"正在提取文件: {i+1}/{total_files}")
-            
-            if progress_callback:
-                progress_callback(100, "ZIP文件提取完成")
-            
-            return temp_dir
+            precision = data[pos + 4]
+            height = int.from_bytes(data[pos + 5:pos + 7], 'big')
+            width = int.from_bytes(data[pos + 7:pos + 9], 'big')
+            color_space = _JPEG_COLOR_SPACES.get(data[pos + 9])
+            if precision != 8 or not width or not height or not color_space:
+                return None
+            return width, height, color_space
+        pos += 2 + length
+    return None
+
+# 计算把 size 缩小到 max_size（宽, 高，任一项可以为None表示不限制）以内的尺寸，保持宽高比，不放大
+def fit_size(size, max_size):
+    width, height = size
+    max_width, max_height = max_size
+    scale = min(max_width / width if max_width else 1, max_height / height if max_height else 1, 1)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+# 判断页面应该按彩色（'RGB'）、灰度（'L'）还是1位黑白（'1'）保存
+# 所有计算都在缩小的副本上由Pillow的C代码完成，每页只需要几毫秒
+def classify_page(img, bitonal=False):
+    if img.mode == 'RGB':
+        sample = img.resize(fit_size(img.size, (GRAY_SAMPLE_SIZE, GRAY_SAMPLE_SIZE)), Image.Resampling.BOX)
+        r, g, b = sample.split()
+        chroma = ImageChops.lighter(ImageChops.lighter(ImageChops.difference(r, g), ImageChops.difference(g, b)),
+                                    ImageChops.difference(r, b))
+        colored = sum(chroma.histogram()[GRAY_CHROMA_THRESHOLD:])
+        if colored > GRAY_MAX_COLOR_RATIO * sample.width * sample.height:
+            return 'RGB'
+    if not bitonal:
+        return 'L'
+    # 线稿检测用最近邻取样，避免缩小时在线条边缘插值出本来没有的中间调
+    sample = img.resize(fit_size(img.size, (BITONAL_SAMPLE_SIZE, BITONAL_SAMPLE_SIZE)), Image.Resampling.NEAREST)
+    histogram = sample.convert('L').histogram()
+    midtones = sum(histogram[BITONAL_BLACK_LEVEL:BITONAL_WHITE_LEVEL])
+    return '1' if midtones <= BITONAL_MAX_MIDTONE_RATIO * sample.width * sample.height else 'L'
+
+# 把已解码的页面编码为PDF页面图像
+# RGB和灰度页面编码为JPEG；1位黑白页面有libtiff时编码为CCITT G4，否则用Flate压缩
+def encode_pil_image(img):
+    if img.mode == '1':
+        if features.check_codec('libtiff'):
+            buf = io.BytesIO()
+            # 写成单条带的G4 TIFF，再按条带偏移取出CCITT数据
+            img.save(buf, 'TIFF', compression='group4', strip_size=math.ceil(img.width / 8) * img.height)
+            with Image.open(buf) as tiff:
+                offsets = tiff.tag_v2.get(273)
+                counts = tiff.tag_v2.get(279)
+            offsets = offsets if isinstance(offsets, tuple) else (offsets,)
+            counts = counts if isinstance(counts, tuple) else (counts,)
+            if len(offsets) == 1 and len(counts) == 1:
+                data = buf.getvalue()[offsets[0]:offsets[0] + counts[0]]
+                parms = {'K': -1, 'Columns': img.width, 'Rows': img.height, 'BlackIs1': True}
+                return PdfImage(img.width, img.height, 'DeviceGray', 1, 'CCITTFaxDecode', data, parms)
+        return PdfImage(img.width, img.height, 'DeviceGray', 1, 'FlateDecode', zlib.compress(img.tobytes()), None)
+    color_space = 'DeviceGray' if img.mode == 'L' else 'DeviceRGB'
+    buf = io.BytesIO()
+    img.save(buf, 'JPEG', quality=JPEG_QUALITY)
+    return PdfImage(img.width, img.height, color_space, 8, 'DCTDecode', buf.getvalue(), None)
+
+# 把一张图片的原始字节转换为PDF页面图像
+# 可直接嵌入的JPEG原样使用，其余格式解码后重新编码
+# 指定 max_size 时把页面缩小到该尺寸以内：JPEG先用draft模式按1/2、1/4、1/8比例直接解码出
+# 接近目标的尺寸，省去解码全尺寸位图的时间和内存，再用高质量重采样缩放到精确尺寸
+# detect_gray=True 时，看起来是黑白的页面按8位灰度保存；bitonal=True 时纯黑白线稿进一步按1位保存
+def encode_page_bytes(data, jpeg_passthrough=True, max_size=None, detect_gray=True, bitonal=False, stats=NO_STATS):
+    if jpeg_passthrough:
+        header = read_jpeg_header(data)
+        if header:
+            width, height, color_space = header
+            if not max_size or fit_size((width, height), max_size) == (width, height):
+                stats.add('passthrough_pages')
+                return PdfImage(width, height, color_space, 8, 'DCTDecode', data, None)
+    with stats.stage('decode'):
+        with Image.open(io.BytesIO(data)) as img:
+            target = fit_size(img.size, max_size) if max_size else img.size
+            if target != img.size:
+                img.draft(None, target)
+            page = img.convert('L' if detect_gray and img.mode in ('1', 'L', 'LA') else 'RGB')
+        if page.size != target:
+            page = page.resize(target, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    return encode_decoded_page(page, detect_gray, bitonal, stats)
+
+# 已解码为RGB或灰度的页面：按需转为灰度或1位黑白后编码
+def encode_decoded_page(page, detect_gray=True, bitonal=False, stats=NO_STATS):
+    if detect_gray:
+        with stats.stage('classify'):
+            mode = classify_page(page, bitonal)
+            if mode != page.mode:
+                # 转为1位时按128阈值二值化，不做抖动
+                page = page.convert('L') if mode == 'L' else page.convert('L').convert('1', dither=Image.Dither.NONE)
+    with stats.stage('encode'):
+        return encode_pil_image(page)
+
+# 条漫每一行的不均匀程度（0-255，以bytes返回，每行一个字节）：把整条图缩成很窄的灰度图（行数不变），
+# 计算每行像素相对该行均值的平均绝对偏差；全部用Pillow的整幅图像运算完成，不逐行循环
+# 各行互不影响，因此按 STRIP_SCAN_BAND 行的横条逐条处理，其他模式的图片也只把横条转为灰度，不复制整条图
+# 留白、纯色背景的行接近0，有画面或文字的行较大
+def row_flatness(img):
+    width, height = img.size
+    columns = min(STRIP_SCAN_COLUMNS, width)
+    flatness = bytearray()
+    for top in range(0, height, STRIP_SCAN_BAND):
+        band = img.crop((0, top, width, min(height, top + STRIP_SCAN_BAND)))
+        if band.mode not in ('L', 'RGB', 'RGBA', 'LA'):
+            band = band.convert('L')
+        rows = band.height
+        narrow = band.resize((columns, rows), Image.Resampling.BOX).convert('L')
+        mean = narrow.resize((1, rows), Image.Resampling.BOX).resize(narrow.size, Image.Resampling.NEAREST)
+        spread = ImageChops.difference(narrow, mean)
+        flatness += spread.resize((1, rows), Image.Resampling.BOX).tobytes()
+    return bytes(flatness)
+
+# 计算条漫的切割位置，返回 [(上边, 下边)] 页面列表；每页不超过 page_height 行（最后一页允许长出 STRIP_TAIL 页）
+def find_strip_cuts(flatness, page_height):
+    height = len(flatness)
+    window = max(1, int(page_height * STRIP_CUT_WINDOW))
+    pages = []
+    top = 0
+    while height - top > page_height * (1 + STRIP_TAIL):
+        target = top + page_height
+        rows = range(max(top + 1, target - window), target + 1)
+        gutters = [y for y in rows if flatness[y] <= STRIP_GUTTER_THRESHOLD]
+        cut = max(gutters) if gutters else min(rows, key=lambda y: (flatness[y], target - y))
+        pages.append((top, cut))
+        top = cut
+    pages.append((top, height))
+    return pages
+
+# 把超长条漫切成高宽比为 aspect 的多个页面并逐页编码，返回页面图像列表
+# 整条图只以原始模式解码一次；转为RGB/灰度、缩小、灰度检测和编码都按页面大小的横条进行，
+# 不会再生成整条图的转换副本，内存占用约为解码后的整条图加一个页面
+def encode_strip_pages(data, aspect, max_size=None, detect_gray=True, bitonal=False, stats=NO_STATS):
+    pages = []
+    with Image.open(io.BytesIO(data)) as img:
+        with stats.stage('decode'):
+            img.load()
+        with stats.stage('slice'):
+            width = img.width
+            cuts = find_strip_cuts(row_flatness(img), max(1, round(width * aspect)))
+        gray = detect_gray and img.mode in ('1', 'L', 'LA')
+        for top, bottom in cuts:
+            with stats.stage('decode'):
+                page = img.crop((0, top, width, bottom)).convert('L' if gray else 'RGB')
+                target = fit_size(page.size, max_size) if max_size else page.size
+                if page.size != target:
+                    page = page.resize(target, Image.Resampling.LANCZOS, reducing_gap=3.0)
+            pages.append(encode_decoded_page(page, detect_gray, bitonal, stats))
+    stats.add('strip_pages', len(pages))
+    return pages
+
+# 把一张页面图片编码为PDF页面图像列表：strip_aspect 不为None且图片是超长条漫（高度超过一页加 STRIP_TAIL 页）时
+# 切成多个页面，否则返回只有一个页面的列表；是否是条漫只看文件头中的尺寸
+def encode_page_images(data, strip_aspect=None, stats=NO_STATS, **encode_options):
+    if strip_aspect:
+        size = read_image_size(data)
+        if size and size[1] > size[0] * strip_aspect * (1 + STRIP_TAIL):
+            options = {key: value for key, value in encode_options.items() if key != 'jpeg_passthrough'}
+            return encode_strip_pages(data, strip_aspect, stats=stats, **options)
+    return [encode_page_bytes(data, stats=stats, **encode_options)]
+
+# 页面图片的内容哈希（原始文件字节的SHA-1），字节完全相同的图片哈希相同
+def page_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+# 页面图片的感知哈希（差值哈希）：重新压缩、轻微缩放过的同一张图片通常得到相同的哈希
+# 用区域平均（BOX）缩小，JPEG的draft缩小解码和完整解码结果一致；末尾附加平均亮度，避免不同深浅的空白页相同
+def perceptual_hash(data):
+    size = PERCEPTUAL_HASH_SIZE
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft('L', (size * 8, size * 8))
+        small = img.convert('L').resize((size + 1, size), Image.Resampling.BOX)
+    pixels = small.tobytes()
+    bits = 0
+    for y in range(size):
+        row = pixels[y * (size + 1):(y + 1) * (size + 1)]
+        for x in range(size):
+            bits = bits << 1 | (row[x] > row[x + 1])
+    return 'p' + format(bits, f'0{size * size // 4}x') + format(sum(pixels) // len(pixels) // 16, 'x')
+
+# 从图片文件或文件夹中读取已知的垃圾页面（汉化组credit页、招募广告等），返回它们的哈希集合
+# 同时收录内容哈希和感知哈希，perceptual=False 时只有字节完全相同的页面会被丢弃
+def load_junk_hashes(paths, perceptual=False):
+    hashes = set()
+    for path in paths:
+        files = [os.path.join(path, f) for f in os.listdir(path)] if os.path.isdir(path) else [path]
+        for file in files:
+            if not is_image_file(file):
+                continue
+            data = read_file_bytes(file)
+            hashes.add(page_hash(data))
+            if perceptual:
+                hashes.add(perceptual_hash(data))
+    return hashes
+
+# 判断ZIP成员是否为图片（跳过目录以及macOS生成的 __MACOSX/ 和 ._ 元数据文件）
+def is_zip_image_member(info):
+    if info.is_dir() or not is_image_file(info.filename):
+        return False
+    parts = info.filename.split('/')
+    return parts[0] != '__MACOSX' and not parts[-1].startswith('._')
+
+# ZIP图片读取器：直接从压缩包中逐个读取图片，不解压到临时目录
+# 未压缩（STORED）的成员从文件的内存映射中直接切片读取
+class ZipImageReader:
+    def __init__(self, zip_file):
+        self.fp = open(zip_file, 'rb')
+        self.mm = None
+        try:
+            self.zip_ref = zipfile.ZipFile(self.fp)
+            members = [info for info in self.zip_ref.infolist() if is_zip_image_member(info)]
+            # 内存映射在这里一次性建立，read() 可以被多个页面线程同时调用
+            if any(info.compress_type == zipfile.ZIP_STORED for info in members):
+                self.mm = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self.fp.close()
+            raise
+        # 按自然顺序排序，先按所在文件夹、再按文件名，支持嵌套文件夹
+        self.members = sorted(members, key=lambda info: natural_sort_key(info.filename))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # 读取一个成员的完整字节（线程安全）
+    def read(self, info):
+        if self.mm is not None and info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:
+            data = self._read_stored(info)
+            if data is not None:
+                return data
+        with self.zip_ref.open(info) as f:
+            return f.read()
+
+    # 只读取一个成员开头的 size 个字节，压缩成员也只解压需要的部分（用于读取图片文件头）
+    def read_prefix(self, info, size):
+        with self.zip_ref.open(info) as f:
+            return f.read(size)
+
+    # 通过本地文件头定位数据区，从内存映射中切片并校验CRC；格式异常时返回None
+    def _read_stored(self, info):
+        header = self.mm[info.header_offset:info.header_offset + 30]
+        if len(header) < 30 or header[:4] != b'PK\x03\x04':
+            return None
+        name_len = int.from_bytes(header[26:28], 'little')
+        extra_len = int.from_bytes(header[28:30], 'little')
+        start = info.header_offset + 30 + name_len + extra_len
+        data = self.mm[start:start + info.compress_size]
+        if len(data) != info.file_size or zlib.crc32(data) != info.CRC:
+            return None
+        return data
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        self.zip_ref.close()
+        self.fp.close()
+
+# 从ZIP文件中读取图片：返回已打开的ZipImageReader，由调用者负责关闭
+# ZIP中没有图片或无法读取时返回None
+def extract_images_from_zip(zip_file, progress_callback=None):
+    if progress_callback:
+        progress_callback(0, f"正在读取ZIP文件: {os.path.basename(zip_file)}")
+    
+    try:
+        reader = ZipImageReader(zip_file)
     except Exception as e:
         if progress_callback:
-            progress_callback(100, f"提取失败: {str(e)}")
-        shutil.rmtree(temp_dir)
+            progress_callback(100, f"读取失败: {str(e)}")
         return None
+    
+    if not reader.members:
+        reader.close()
+        return None
+    
+    if progress_callback:
+        progress_callback(100, f"ZIP中找到 {len(reader.members)} 个图片文件")
+    
+    return reader
+
+# 预扫描索引中的一页：文件名（ZIP中为成员路径）、字节数，以及从文件头读出的像素尺寸（未读取时为None）
+PageInfo = namedtuple('PageInfo', ['name', 'size', 'width', 'height'])
+
+# 预扫描索引中的一个源（图片文件夹或ZIP）：pages 按转换顺序排列；fingerprint 用于增量转换，无法读取时为None
+SourceInfo = namedtuple('SourceInfo', ['path', 'kind', 'pages', 'total_bytes', 'fingerprint'])
+
+# 只解析图片文件头得到 (宽, 高)，不解码像素；头部不完整或无法识别时返回None
+# WEBP在Pillow中需要完整数据才能打开，这里直接读取VP8/VP8L/VP8X块头
+def read_image_size(header):
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP' and len(header) >= 30:
+        chunk = header[12:16]
+        if chunk == b'VP8 ':
+            return (int.from_bytes(header[26:28], 'little') & 0x3FFF,
+                    int.from_bytes(header[28:30], 'little') & 0x3FFF)
+        if chunk == b'VP8L':
+            bits = int.from_bytes(header[21:25], 'little')
+            return (bits & 0x3FFF) + 1, (bits >> 14 & 0x3FFF) + 1
+        if chunk == b'VP8X':
+            return int.from_bytes(header[24:27], 'little') + 1, int.from_bytes(header[27:30], 'little') + 1
+        return None
+    try:
+        with Image.open(io.BytesIO(header)) as img:
+            return img.size
+    except Exception:
+        return None
+
+# 逐步加长读取的文件头来解析图片尺寸；read_prefix(n) 返回前n个字节
+def probe_image_size(read_prefix, file_size):
+    for limit in (HEADER_PROBE_BYTES, HEADER_PROBE_MAX_BYTES, file_size):
+        size = read_image_size(read_prefix(limit))
+        if size or limit >= file_size:
+            return size
+    return None
+
+# 预扫描一个源，只读取目录项、ZIP中央目录，以及 dimensions=True 时每张图片的文件头，不解码任何图片
+# 文件夹用一次 os.scandir 取得文件名、大小和修改时间；指纹的算法与增量清单中保存的一致
+# 无法读取时返回None
+def scan_source(source, dimensions=False):
+    digest = hashlib.sha1()
+    try:
+        if os.path.isdir(source):
+            entries = []
+            with os.scandir(source) as it:
+                for entry in it:
+                    if entry.is_file() and is_image_file(entry.name):
+                        stat = entry.stat()
+                        entries.append((entry.name, stat.st_size, stat.st_mtime_ns))
+            for name, size, mtime in sorted(entries):
+                digest.update(f"{name}\0{size}\0{mtime}\n".encode('utf-8'))
+            pages = []
+            for name, size, _ in sorted(entries, key=lambda entry: natural_sort_key(entry[0])):
+                width = height = None
+                if dimensions:
+                    path = os.path.join(source, name)
+                    width, height = probe_image_size(lambda n: read_file_prefix(path, n), size) or (None, None)
+                pages.append(PageInfo(name, size, width, height))
+            kind = 'folder'
+        else:
+            with ZipImageReader(source) as reader:
+                for info in reader.zip_ref.infolist():
+                    if is_zip_image_member(info):
+                        digest.update(f"{info.filename}\0{info.CRC}\0{info.file_size}\n".encode('utf-8'))
+                pages = []
+                for info in reader.members:
+                    width = height = None
+                    if dimensions:
+                        width, height = (probe_image_size(lambda n: reader.read_prefix(info, n), info.file_size)
+                                         or (None, None))
+                    pages.append(PageInfo(info.filename, info.file_size, width, height))
+            kind = 'zip'
+    except (OSError, zipfile.BadZipFile):
+        return None
+    return SourceInfo(source, kind, pages, sum(page.size for page in pages), digest.hexdigest())
+
+# 进度快照：stage 为当前阶段的说明文字，percent 为0-100；页数、字节数、吞吐量（字节/秒、页/秒）
+# 和剩余时间（秒）在生产者没有提供或尚无法估计时为None
+ProgressSnapshot = namedtuple('ProgressSnapshot', ['stage', 'percent', 'pages_done', 'pages_total', 'bytes_done',
+                                                   'bytes_total', 'bytes_per_second', 'pages_per_second', 'eta'])
+
+# 调用进度回调。公开的回调协议是 progress_callback(百分比, 状态文字)；页数、字节数等明细只以关键字参数传给
+# 声明了 progress_detail = True 的回调（如 ProgressSlot.post），普通的两参数回调照常工作
+def report_progress(progress_callback, percent, status, **detail):
+    if getattr(progress_callback, 'progress_detail', False):
+        progress_callback(percent, status, **detail)
+    else:
+        progress_callback(percent, status)
+
+# 线程安全的“最新值”进度槽：工作线程通过 post 覆盖写入最新进度（可以作为 progress_callback 使用），
+# 开销只有一次加锁赋值；界面线程按固定频率调用 poll 取走最新值，中间的更新自然合并，不会堆积在Tk事件队列中
+class ProgressSlot:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest = None
+        self._fresh = False
+        self._start = None
+        self._cancelled = None
+
+    def post(self, percent, stage, **detail):
+        now = time.monotonic()
+        with self._lock:
+            if self._start is None:
+                self._start = now
+            self._latest = (now, percent, stage, detail)
+            self._fresh = True
+
+    post.progress_detail = True
+
+    # 请求取消后状态文字固定为 message，之后写入的进度只更新百分比和吞吐量，直到任务报告100%
+    def cancel(self, message):
+        with self._lock:
+            self._cancelled = message
+            self._fresh = True
+
+    # 有新进度时返回 ProgressSnapshot，否则返回None；吞吐量和剩余时间按开始以来的平均速度计算
+    def poll(self):
+        with self._lock:
+            if not self._fresh:
+                return None
+            self._fresh = False
+            now, percent, stage, detail = self._latest or (time.monotonic(), 0, None, {})
+            elapsed = now - self._start if self._start is not None else 0
+            if self._cancelled and percent < 100:
+                stage = self._cancelled
+        pages_done = detail.get('pages_done')
+        bytes_done = detail.get('bytes_done')
+        eta = elapsed * (100 - percent) / percent if elapsed > 0 and 0 < percent < 100 else None
+        return ProgressSnapshot(stage, percent, pages_done, detail.get('pages_total'), bytes_done,
+                                detail.get('bytes_total'),
+                                bytes_done / elapsed if bytes_done and elapsed > 0 else None,
+                                pages_done / elapsed if pages_done and elapsed > 0 else None, eta)
+
+# 把进度快照整理成一行文字：百分比、吞吐量和剩余时间
+def format_progress_snapshot(snapshot):
+    parts = [f"{int(snapshot.percent)}%"]
+    if snapshot.bytes_per_second:
+        parts.append(f"{snapshot.bytes_per_second / 2**20:.1f} MB/s")
+    if snapshot.pages_per_second:
+        parts.append(f"{snapshot.pages_per_second:.1f} 页/秒")
+    if snapshot.eta is not None:
+        minutes, seconds = divmod(int(snapshot.eta), 60)
+        parts.append(f"剩余 {minutes}:{seconds:02d}")
+    return "  ·  ".join(parts)
 
 # 创建进度条窗口
 def create_progress_window(parent, title="处理中"):
+    import tkinter as tk
+    from tkinter import ttk
+    
     progress_window = tk.Toplevel(parent)
     progress_window.title(title)
     progress_window.geometry("400x150")
@@ -100,118 +893,464 @@ def create_progress_window(parent, title="处理中"):
     percent_label = tk.Label(frame, text="0%")
     percent_label.pack()
     
-    # 防止关闭按钮
+    # 默认禁用关闭按钮；可以取消的任务由 run_in_thread 接管
     progress_window.protocol("WM_DELETE_WINDOW", lambda: None)
     
     return progress_window, progress, status_label, percent_label
 
+# 任务被用户取消时抛出
+class ConversionCancelled(Exception):
+    pass
+
+# 原子写出：先写到同目录下的临时文件，成功后再改名为目标文件；失败或取消时删除临时文件
+# 因此输出路径上要么是完整的新文件，要么保持原样，不会留下写了一半的PDF
+# finalize(临时文件路径) 在临时文件关闭之后、改名之前调用（例如线性化），它失败时同样不会留下输出文件
+# 临时文件名包含主机名和进程号（<输出>.<主机名>-<进程号>.part）：分布式模式下多台机器在共享存储上写同一个输出也不会冲突
+@contextlib.contextmanager
+def atomic_output(path, finalize=None):
+    temp_path = f"{path}.{host_tag()}-{os.getpid()}.part"
+    try:
+        with open(temp_path, 'wb') as fp:
+            yield fp
+        if finalize:
+            finalize(temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+
+# 写进临时文件名的本机名：只保留字母、数字和连字符（不含点号，便于从文件名中解析），不需要导入 socket
+def host_tag():
+    host = os.uname().nodename if hasattr(os, 'uname') else os.environ.get('COMPUTERNAME', '')
+    return re.sub(r'[^0-9A-Za-z-]', '-', host) or 'localhost'
+
+# 本机上进程号为 pid 的进程是否还在运行；无法确定时按仍在运行处理
+# Windows 上的 os.kill 会结束目标进程，因此改用 OpenProcess / GetExitCodeProcess 查询
+def pid_alive(pid):
+    if pid == os.getpid():
+        return True
+    if sys.platform == 'win32':
+        import ctypes
+        kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return ctypes.get_last_error() != 87  # ERROR_INVALID_PARAMETER：没有这个进程
+        try:
+            code = ctypes.c_ulong()
+            return not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)) or code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+# 输出文件上次崩溃时留下的临时文件（见 atomic_output）：由本机写出，并且文件名中的进程号是本进程或已经不在运行；
+# 其他仍在运行的进程（例如同时对同一个输出文件夹运行的另一个批量任务）正在写的临时文件不算；
+# 其他机器（分布式模式的工作节点）写的临时文件无法判断进程是否还在运行，一律不删
+def stale_part_files(output_pdf):
+    prefix = os.path.basename(output_pdf) + '.'
+    host = host_tag()
+    for path in glob.glob(glob.escape(output_pdf) + '.*.part'):
+        part_host, _, pid = os.path.basename(path)[len(prefix):].split('.')[0].rpartition('-')
+        if part_host == host and pid.isdigit() and (int(pid) == os.getpid() or not pid_alive(int(pid))):
+            yield path
+
+# 按顺序产出已准备好的页面：多个线程并行读取和解码/编码，结果按原顺序交给写入端
+# 已提交但尚未取走的页面数不超过 queue_depth，写入慢时读取端会自动等待
+def iter_prepared_pages(pages, prepare, workers, queue_depth):
+    if workers <= 1:
+        for page in pages:
+            yield prepare(page)
+        return
+    
+    pool = ThreadPoolExecutor(max_workers=workers)
+    in_flight = deque()
+    try:
+        for page in pages:
+            in_flight.append(pool.submit(prepare, page))
+            if len(in_flight) >= queue_depth:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+# 逐页读取、编码并写入PDF，写完即释放，内存占用与页数无关
+# read_page(page) 返回页面图片的原始字节；进度从20%推进到95%，同时报告已处理的页数和原始字节数
+# encode_options 是传给 encode_page_images 的页面编码参数（超长条漫可以切成多个页面）；cancel_event 被设置时在页面之间抛出 ConversionCancelled
+# dedupe=True 时按内容哈希识别重复的页面图片，只编码和写入一次，重复页面共用同一个图像XObject；
+# perceptual_dedupe=True 时改用感知哈希，重新压缩过的相同图片也视为重复；哈希在 junk_hashes 中的页面直接丢弃，全部页面都被丢弃时抛出 ValueError
+# stats 记录读取、哈希、解码、编码和写入各阶段的耗时，以及页数和读入、写出的字节数；finalize 见 atomic_output
+def write_pages_to_pdf(pages, read_page, output_pdf, progress_callback=None, encode_options=None,
+                       page_workers=None, cancel_event=None, dedupe=True, perceptual_dedupe=False, junk_hashes=None,
+                       finalize=None, stats=NO_STATS):
+    encode_options = encode_options or {}
+    junk_hashes = set(junk_hashes or ())
+    total_files = len(pages)
+    workers = max(1, min(page_workers or PAGE_WORKERS or os.cpu_count() or 1, total_files))
+    
+    # 哈希 -> 编码结果；第一个遇到某张图片的线程负责编码，其余重复页面直接等待同一个结果
+    claimed = {}
+    claimed_lock = threading.Lock()
+    already_written = Future()
+    already_written.set_result(None)
+    
+    # 返回 (哈希, 编码结果的Future, 原始字节数)；需要丢弃的页面返回 (None, None, 原始字节数)
+    def prepare(page):
+        with stats.stage('read'):
+            data = read_page(page)
+        size = len(data)
+        with stats.stage('hash'):
+            keys = [page_hash(data)] if dedupe or junk_hashes else []
+            if perceptual_dedupe:
+                keys.append(perceptual_hash(data))
+        if any(key in junk_hashes for key in keys):
+            return None, None, size
+        key = keys[-1] if dedupe and keys else None
+        with claimed_lock:
+            shared = claimed.get(key) if key else None
+            owner = shared is None
+            if owner:
+                shared = Future()
+                if key:
+                    claimed[key] = shared
+        if owner:
+            try:
+                shared.set_result(encode_page_images(data, stats=stats, **encode_options))
+            except BaseException as e:
+                shared.set_exception(e)
+                raise
+        return key, shared, size
+    
+    with atomic_output(output_pdf, finalize) as fp:
+        writer = PdfStreamWriter(fp, title=os.path.splitext(os.path.basename(output_pdf))[0])
+        written = {}  # 哈希 -> [(不含数据的页面图像, 图像XObject引用)]，条漫切成的每一页各一项
+        shared_count = dropped_count = bytes_done = page_count = 0
+        prepared = iter_prepared_pages(pages, prepare, workers, workers * PAGE_QUEUE_DEPTH_PER_WORKER)
+        for i, (key, shared, size) in enumerate(prepared):
+            if cancel_event is not None and cancel_event.is_set():
+                raise ConversionCancelled()
+            if shared is None:
+                dropped_count += 1
+            elif key in written:
+                with stats.stage('write'):
+                    for image, image_ref in written[key]:
+                        writer.add_image_page(image, image_ref)
+                shared_count += 1
+                page_count += len(written[key])
+            else:
+                images = []
+                with stats.stage('write'):
+                    for image in shared.result():
+                        image_ref = writer.add_image(image)
+                        writer.add_image_page(image, image_ref)
+                        images.append((image._replace(data=None), image_ref))
+                page_count += len(images)
+                if key:
+                    written[key] = images
+                    # 已写出的图像不再需要保留编码数据
+                    with claimed_lock:
+                        claimed[key] = already_written
+            
+            bytes_done += size
+            if progress_callback:
+                progress = 20 + (i + 1) / total_files * 75  # 从20%到95%
+                report_progress(progress_callback, progress, f"正在处理图片: {i+1}/{total_files}",
+                                pages_done=i + 1, pages_total=total_files, bytes_done=bytes_done)
+        
+        # 所有页面都被当作垃圾页面丢弃时不写出0页的PDF，而是作为失败处理（atomic_output 会删除临时文件）
+        if not page_count:
+            raise ValueError(f"全部 {dropped_count} 个页面都与垃圾页面匹配，没有可写入的页面")
+        
+        if progress_callback:
+            progress_callback(95, "正在生成PDF文件...")
+        
+        with stats.stage('write'):
+            writer.close()
+        stats.add('pages', page_count)
+        stats.add('bytes_in', bytes_done)
+        stats.add('bytes_out', fp.tell())
+        stats.add('shared_pages', shared_count)
+        stats.add('dropped_pages', dropped_count)
+    
+    if shared_count or dropped_count:
+        print(f"{shared_count} duplicate pages share images, {dropped_count} junk pages dropped: {output_pdf}")
+
+# 读取图片文件的全部字节
+def read_file_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+# 读取文件开头的 size 个字节
+def read_file_prefix(path, size):
+    with open(path, 'rb') as f:
+        return f.read(size)
+
+# 没有安装 pikepdf 时的错误信息
+LINEARIZE_REQUIRES_PIKEPDF = "线性化输出需要安装 pikepdf：pip install pikepdf"
+
+# 把PDF重写为线性化（“快速网页查看”）格式：第一页需要的对象和提示表放在文件开头，其余对象压缩进对象流，
+# 交叉引用写成交叉引用流，按范围请求读取的阅读器不必下载整个文件就能显示第一页
+# 线性化由 qpdf 完成（需要 pip install pikepdf）；图片等流数据原样复制，按需从原文件读取，不会整体载入内存
+# 先写临时文件再替换，失败时原文件保持不变；替换之前先关闭原文件（Windows 上无法替换仍被打开的文件）
+def linearize_pdf(path):
+    try:
+        import pikepdf
+    except ImportError:
+        raise RuntimeError(LINEARIZE_REQUIRES_PIKEPDF)
+    with atomic_output(path) as fp:
+        with pikepdf.open(path) as pdf:
+            pdf.save(fp, linearize=True, object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                     stream_decode_level=pikepdf.StreamDecodeLevel.none)
+
+# 返回传给 atomic_output 的 finalize：在改名之前原地线性化临时文件，并把大小的变化计入 stats 的写出字节数
+# 线性化失败时临时文件随之删除，不会留下未线性化的输出；linearize=False 时返回None
+def _linearize_output(linearize, progress_callback, stats):
+    if not linearize:
+        return None
+    
+    def finalize(path):
+        if progress_callback:
+            progress_callback(97, "正在线性化PDF...")
+        size = os.path.getsize(path)
+        with stats.stage('linearize'):
+            linearize_pdf(path)
+        stats.add('bytes_out', os.path.getsize(path) - size)
+    return finalize
+
 # 将图片合并成PDF
-def images_to_pdf(image_folder, output_pdf, is_temp_dir=False, progress_callback=None):
+# max_size=(最大宽度, 最大高度) 时把页面缩小到该像素尺寸以内（任一项可以为None）
+# detect_gray 自动把黑白页面保存为灰度；bitonal 进一步把纯线稿保存为1位黑白
+# dedupe / perceptual_dedupe / junk_hashes 控制重复页面的共用和垃圾页面的丢弃，见 write_pages_to_pdf
+# stats 为 RunStats 时记录扫描、读取、解码、编码和写入各阶段的耗时；linearize=True 时输出线性化的PDF，见 linearize_pdf
+# strip_aspect 不为None时把超长条漫切成高宽比为 strip_aspect 的多个页面，切割点尽量落在留白处，见 encode_strip_pages
+# is_temp_dir 只为兼容旧的按位置传参的调用而保留，已不再使用（ZIP直接从压缩包中读取，没有临时目录）；其余新参数只能按关键字传递
+def images_to_pdf(image_folder, output_pdf, is_temp_dir=False, progress_callback=None, *, jpeg_passthrough=True,
+                  page_workers=None, cancel_event=None, max_size=None, detect_gray=True, bitonal=False,
+                  dedupe=True, perceptual_dedupe=False, junk_hashes=None, linearize=False, strip_aspect=None,
+                  stats=NO_STATS):
+    encode_options = {'jpeg_passthrough': jpeg_passthrough, 'max_size': max_size,
+                      'detect_gray': detect_gray, 'bitonal': bitonal, 'strip_aspect': strip_aspect}
+    page_options = {'dedupe': dedupe, 'perceptual_dedupe': perceptual_dedupe, 'junk_hashes': junk_hashes,
+                    'finalize': _linearize_output(linearize, progress_callback, stats), 'stats': stats}
     try:
         # 获取所有图片文件
         if os.path.isdir(image_folder):
             if progress_callback:
                 progress_callback(0, f"正在扫描图片文件...")
             
-            image_files = [f for f in os.listdir(image_folder) if is_image_file(f)]
+            with stats.stage('scan'):
+                info = scan_source(image_folder)
             
-            if not image_files:
+            if not info or not info.pages:
                 if progress_callback:
                     progress_callback(100, "没有找到图片文件")
                 return False
             
             if progress_callback:
-                progress_callback(10, f"找到 {len(image_files)} 个图片文件，正在排序...")
+                progress_callback(20, f"找到 {len(info.pages)} 个图片文件，正在加载图片...")
             
-            sorted_files = sorted(image_files, key=extract_number)
-            
-            if progress_callback:
-                progress_callback(20, "正在加载图片...")
-            
-            images = []
-            total_files = len(sorted_files)
-            
-            for i, img_file in enumerate(sorted_files):
-                img_path = os.path.join(image_folder, img_file)
-                images.append(Image.open(img_path).convert('RGB'))
-                
-                if progress_callback:
-                    progress = 20 + (i + 1) / total_files * 60  # 从20%到80%
-                    progress_callback(progress, f"正在处理图片: {i+1}/{total_files}")
+            image_paths = [os.path.join(image_folder, page.name) for page in info.pages]
+            write_pages_to_pdf(image_paths, read_file_bytes, output_pdf, progress_callback, encode_options,
+                               page_workers, cancel_event, **page_options)
         else:
-            # 如果是ZIP文件
+            # 如果是ZIP文件：直接从压缩包中读取图片，不解压
             if progress_callback:
                 progress_callback(0, f"正在处理ZIP文件: {os.path.basename(image_folder)}")
             
-            temp_dir = extract_images_from_zip(image_folder, 
-                                             lambda p, s: progress_callback(p * 0.5, s) if progress_callback else None)
+            with stats.stage('scan'):
+                reader = extract_images_from_zip(image_folder,
+                                                 lambda p, s: progress_callback(p * 0.2, s) if progress_callback else None)
             
-            if temp_dir:
-                # 递归调用自身，但使用提取的临时目录
-                if progress_callback:
-                    progress_callback(50, "ZIP提取完成，开始处理图片...")
-                
-                # 为递归调用创建一个进度回调函数，将50%-100%映射到原始的50%-100%
-                def nested_callback(p, s):
-                    if progress_callback:
-                        mapped_progress = 50 + p * 0.5
-                        progress_callback(mapped_progress, s)
-                
-                result = images_to_pdf(temp_dir, output_pdf, True, nested_callback)
-                # 清理临时目录
-                shutil.rmtree(temp_dir)
-                return result
-            else:
+            if not reader:
                 if progress_callback:
                     progress_callback(100, "ZIP文件中没有找到图片")
                 return False
-        
-        if images:
-            if progress_callback:
-                progress_callback(80, "正在生成PDF文件...")
-            
-            images[0].save(output_pdf, save_all=True, append_images=images[1:])
-            
-            if progress_callback:
-                progress_callback(100, f"PDF创建成功: {os.path.basename(output_pdf)}")
-            
-            print(f"PDF created successfully: {output_pdf}")
-            return True
-        else:
-            if progress_callback:
-                progress_callback(100, "没有找到图片文件")
             
-            print("No images found in the folder.")
-            return False
+            with reader:
+                if progress_callback:
+                    progress_callback(20, "正在加载图片...")
+                
+                write_pages_to_pdf(reader.members, reader.read, output_pdf, progress_callback, encode_options,
+                                   page_workers, cancel_event, **page_options)
+        
+        if progress_callback:
+            progress_callback(100, f"PDF创建成功: {os.path.basename(output_pdf)}")
+        
+        print(f"PDF created successfully: {output_pdf}")
+        return True
+    except ConversionCancelled:
+        if progress_callback:
+            progress_callback(100, "已取消")
+        return False
     except Exception as e:
         if progress_callback:
             progress_callback(100, f"错误: {str(e)}")
         
         print(f"Error creating PDF: {e}")
         return False
-    finally:
-        # 如果是临时目录且函数是被递归调用的，不在这里删除
-        # 让调用者负责删除临时目录
-        pass
 
-# 合并多个PDF文件
-def merge_pdfs(pdf_files, output_pdf, progress_callback=None):
-    try:
-        merger = PdfMerger()
+# 把 PyPDF2 读出的对象转换为 pdf_serialize 可以写出的形式；间接引用交给 map_ref 映射
+# 数字、字符串、名称等叶子对象按 PyPDF2 的序列化结果原样保留
+def _pypdf_to_pdf(value, map_ref):
+    from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject
+    
+    if isinstance(value, IndirectObject):
+        return map_ref(value)
+    if isinstance(value, DictionaryObject):
+        return {key[1:]: _pypdf_to_pdf(item, map_ref) for key, item in value.items()}
+    if isinstance(value, ArrayObject):
+        return [_pypdf_to_pdf(item, map_ref) for item in value]
+    buf = io.BytesIO()
+    value.write_to_stream(buf, None)
+    return PdfRaw(buf.getvalue())
+
+# 把一个PDF的全部页面复制到 writer 中，返回复制的页数
+# 页面及其引用的对象（内容流、图片、字体等）重新编号后逐个写出，每页写完就清空读取器的对象缓存，
+# 因此同一时间只有当前页面的对象在内存中；输入文件也不整体读入内存，而是按需从磁盘读取
+# bookmark 不为None时添加一个指向首页的书签，原文件自带的书签挂在它下面
+# stream_index 是在多个输入之间共享的 {流内容哈希: 对象引用} 字典，不为None时内容完全相同的流（图片、内容流、
+# ICC配置等）只写出一次；只包含一张图片、且图片数据的内容哈希在 junk_hashes 中的页面被丢弃
+def copy_pdf_into(writer, pdf_path, bookmark=None, stream_index=None, junk_hashes=None):
+    from PyPDF2 import PdfReader
+    from PyPDF2.generic import DictionaryObject, IndirectObject, NumberObject, StreamObject
+    
+    def is_junk_page(page):
+        try:
+            xobjects = page['/Resources']['/XObject']
+            images = [xobject.get_object() for xobject in xobjects.values()]
+        except (KeyError, TypeError):
+            return False
+        return (len(images) == 1 and images[0].get('/Subtype') == '/Image'
+                and page_hash(images[0]._data) in junk_hashes)
+    
+    with open(pdf_path, 'rb') as fp:
+        reader = PdfReader(fp)
+        pages = list(reader.pages)
+        if junk_hashes:
+            kept = []
+            for page in pages:
+                if not is_junk_page(page):
+                    kept.append(page)
+                reader.resolved_objects.clear()
+            if len(kept) < len(pages):
+                print(f"{len(pages) - len(kept)} junk pages dropped: {pdf_path}")
+            pages = kept
+        # 先为所有页面预留编号，这样链接、书签等指向其他页面的引用可以直接映射
+        page_map = {page.indirect_reference.idnum: writer.alloc() for page in pages}
+        refs = {}
+        pending = deque()
+        hashing = set()
+        
+        def map_ref(indirect):
+            if indirect.idnum in page_map:
+                return page_map[indirect.idnum]
+            key = (indirect.idnum, indirect.generation)
+            if key in refs:
+                return refs[key]
+            obj = indirect.get_object()
+            obj_type = obj.get('/Type') if isinstance(obj, DictionaryObject) else None
+            if obj_type == '/Pages':
+                refs[key] = writer.pages_ref  # 原文件的页面树节点统一指向新的页面树
+            elif obj_type in ('/Catalog', '/Page') or obj is None:
+                refs[key] = None  # 被丢弃的页面也不复制
+            elif isinstance(obj, StreamObject) and stream_index is not None and key not in hashing:
+                # 流的字典（其中的引用已映射为新编号）和原始数据都相同时共用同一个对象
+                hashing.add(key)
+                stream_dict = {name[1:]: convert(item) for name, item in obj.items() if name != '/Length'}
+                hashing.discard(key)
+                if key not in refs:  # 循环引用时已经在转换字典的过程中分配了编号
+                    digest = hashlib.sha1(pdf_serialize(stream_dict) + b'\0' + obj._data).digest()
+                    if digest not in stream_index:
+                        stream_index[digest] = writer.alloc()
+                        pending.append((stream_index[digest], obj))
+                    refs[key] = stream_index[digest]
+            else:
+                refs[key] = writer.alloc()
+                pending.append((refs[key], obj))
+            return refs[key]
+        
+        def convert(value):
+            return _pypdf_to_pdf(value, map_ref)
+        
+        for page in pages:
+            writer.add_page({key[1:]: convert(item) for key, item in page.items()
+                             if key not in ('/Type', '/Parent')},
+                            ref=page_map[page.indirect_reference.idnum])
+            while pending:
+                ref, obj = pending.popleft()
+                if isinstance(obj, StreamObject):
+                    # 流数据保持原有编码直接复制；Length 由写入器重新计算
+                    writer.write_obj(ref, {key[1:]: convert(item) for key, item in obj.items() if key != '/Length'},
+                                     stream=obj._data)
+                else:
+                    writer.write_obj(ref, convert(obj))
+            reader.resolved_objects.clear()
+        
+        if bookmark is not None and pages:
+            page_refs = [page_map[page.indirect_reference.idnum] for page in pages]
+            
+            def make_dest(node):
+                target = node.raw_get('/Page')
+                if isinstance(target, IndirectObject):
+                    target = page_map.get(target.idnum)
+                elif isinstance(target, NumberObject) and 0 <= target < len(page_refs):
+                    target = page_refs[target]
+                else:
+                    return None
+                return [target] + [convert(item) for item in list(node.dest_array)[1:]] if target else None
+            
+            def convert_outline(nodes):
+                items = []
+                for node in nodes:
+                    if isinstance(node, list):
+                        if items:
+                            items[-1].children.extend(convert_outline(node))
+                    else:
+                        items.append(PdfOutline(str(node.title or ''), make_dest(node), []))
+                return items
+            
+            try:
+                children = convert_outline(reader.outline)
+            except Exception as e:
+                print(f"Skipping bookmarks of {pdf_path}: {e}")
+                children = []
+            writer.outlines.append(PdfOutline(bookmark, [page_refs[0], 'Fit'], children))
         
+        return len(pages)
+
+# 合并多个PDF文件：逐个输入文件流式复制页面，每个文件生成一个以文件名命名的书签
+# dedupe=True 时各文件中重复的图片（如每卷都有的credit页）只保留一份；junk_hashes 见 copy_pdf_into
+# stats 记录每个文件的复制耗时（copy）和最后写出页面树、书签和xref的耗时（write）；linearize 见 linearize_pdf
+def merge_pdfs(pdf_files, output_pdf, progress_callback=None, dedupe=True, junk_hashes=None, linearize=False,
+               stats=NO_STATS):
+    try:
         total_files = len(pdf_files)
-        for i, pdf in enumerate(pdf_files):
+        stream_index = {} if dedupe else None
+        with atomic_output(output_pdf, _linearize_output(linearize, progress_callback, stats)) as fp:
+            writer = PdfStreamWriter(fp, title=os.path.splitext(os.path.basename(output_pdf))[0])
+            for i, pdf in enumerate(pdf_files):
+                if progress_callback:
+                    progress = (i / total_files) * 90  # 保留最后10%用于写入文件
+                    progress_callback(progress, f"正在合并PDF: {i+1}/{total_files}")
+                
+                with stats.stage('copy'):
+                    pages = copy_pdf_into(writer, pdf, bookmark=os.path.splitext(os.path.basename(pdf))[0],
+                                          stream_index=stream_index, junk_hashes=junk_hashes)
+                stats.add('pages', pages)
+                stats.add('bytes_in', os.path.getsize(pdf))
+            
             if progress_callback:
-                progress = (i / total_files) * 90  # 保留最后10%用于写入文件
-                progress_callback(progress, f"正在合并PDF: {i+1}/{total_files}")
+                progress_callback(90, "正在写入合并后的PDF文件...")
             
-            merger.append(pdf)
-        
-        if progress_callback:
-            progress_callback(90, "正在写入合并后的PDF文件...")
-        
-        merger.write(output_pdf)
-        merger.close()
+            with stats.stage('write'):
+                writer.close()
+            stats.add('bytes_out', fp.tell())
         
         if progress_callback:
             progress_callback(100, f"PDF合并成功: {os.path.basename(output_pdf)}")
@@ -225,23 +1364,1470 @@ def merge_pdfs(pdf_files, output_pdf, progress_callback=None):
         print(f"Error merging PDFs: {e}")
         return False
 
+# 增量更新写入器：在已有PDF的末尾追加新对象，不改动原有字节
+# 页面树根节点、目录和书签中需要修改的对象以原编号重新写出，新的xref段通过 Prev 链接到原来的xref；
+# 原文件使用交叉引用流（PDF 1.5+）时，新的xref段也写成交叉引用流
+# reader 是在同一文件上打开的 PyPDF2 PdfReader，只在构造时用来读取trailer、目录、页面树根节点和书签根节点
+class PdfAppendWriter(PdfStreamWriter):
+    def __init__(self, fp, reader):
+        if reader.is_encrypted:
+            raise ValueError("不支持向加密的PDF追加页面")
+        self.fp = fp
+        self.pos = fp.seek(0, os.SEEK_END)
+        self.offsets = {}
+        self.page_refs = []
+        self.outlines = []
+        self.title = None
+        self.startxref, self.xref_stream = self._read_startxref(fp, self.pos)
+        
+        # 交叉引用流的trailer中 PyPDF2 不保留 /Size，这时按已知的最大对象编号计算
+        trailer = reader.trailer
+        known = [num for section in reader.xref.values() for num in section] + list(reader.xref_objStm)
+        self.next_num = max([int(trailer.get('/Size', 0))] + [num + 1 for num in known])
+        self.trailer = {key[1:]: self._convert(trailer.raw_get(key)) for key in ('/Root', '/Info', '/ID')
+                        if key in trailer}
+        self.root_ref = self.trailer['Root']
+        catalog = trailer['/Root']
+        self.catalog = self._convert(catalog)
+        
+        self.pages_ref = self._convert(catalog.raw_get('/Pages'))
+        pages = catalog['/Pages']
+        self.pages = {key[1:]: self._convert(item) for key, item in pages.items() if key not in ('/Kids', '/Count')}
+        self.old_kids = self._convert(pages['/Kids'])
+        self.old_count = int(pages['/Count'])
+        
+        # 已有的书签：新书签接在最后一个顶层书签后面
+        self.outline_ref = self.outline_root = self.last_item_ref = self.last_item = None
+        if '/Outlines' in catalog and isinstance(catalog['/Outlines'], dict):
+            outline_root = catalog['/Outlines']
+            self.outline_ref = self._convert(catalog.raw_get('/Outlines'))
+            self.outline_root = self._convert(outline_root)
+            self.outline_count = abs(int(outline_root['/Count'])) if '/Count' in outline_root else 0
+            if '/Last' in outline_root:
+                self.last_item_ref = self._convert(outline_root.raw_get('/Last'))
+                self.last_item = self._convert(outline_root['/Last'])
+        
+        self._write(b'\n')  # 保证新内容从新的一行开始
+    
+    # 原文件中的引用保持原编号；只支持0代对象（重新写出的对象需要同样的编号和代号）
+    @staticmethod
+    def _same_ref(indirect):
+        if indirect.generation != 0:
+            raise ValueError(f"不支持修改非0代对象: {indirect.idnum} {indirect.generation} R")
+        return PdfRef(indirect.idnum)
+    
+    def _convert(self, value):
+        return _pypdf_to_pdf(value, self._same_ref)
+    
+    # 从文件末尾读取最后一个 startxref 的偏移，并判断该处是xref表还是交叉引用流
+    @staticmethod
+    def _read_startxref(fp, size):
+        fp.seek(max(0, size - 2048))
+        matches = re.findall(rb'startxref\s+(\d+)', fp.read())
+        if not matches:
+            raise ValueError("找不到 startxref，文件可能已损坏")
+        offset = int(matches[-1])
+        fp.seek(offset)
+        is_stream = not fp.read(4).startswith(b'xref')
+        fp.seek(0, os.SEEK_END)
+        return offset, is_stream
+    
+    # 写出更新后的页面树根节点和书签，以及新的xref段和trailer
+    def close(self):
+        self.write_obj(self.pages_ref, dict(self.pages, Kids=self.old_kids + self.page_refs,
+                                            Count=self.old_count + len(self.page_refs)))
+        if self.outlines and self.outline_ref:
+            refs = self._write_outline_items(self.outlines, self.outline_ref, prev_ref=self.last_item_ref)
+            if self.last_item_ref:
+                self.write_obj(self.last_item_ref, dict(self.last_item, Next=refs[0]))
+            self.write_obj(self.outline_ref, dict(self.outline_root, First=self.outline_root.get('First') or refs[0],
+                                                  Last=refs[-1], Count=self.outline_count + len(refs)))
+        elif self.outlines:
+            outline_ref = self.alloc()
+            refs = self._write_outline_items(self.outlines, outline_ref)
+            self.write_obj(outline_ref, {'Type': 'Outlines', 'First': refs[0], 'Last': refs[-1], 'Count': len(refs)})
+            self.write_obj(self.root_ref, dict(self.catalog, Outlines=outline_ref,
+                                               PageMode=self.catalog.get('PageMode') or 'UseOutlines'))
+        
+        trailer = dict(self.trailer, Prev=self.startxref)
+        if self.xref_stream:
+            xref_ref = self.alloc()
+            xref_pos = self.offsets[xref_ref.num] = self.pos
+            sections = self._xref_sections()
+            width = max(4, (self.pos.bit_length() + 7) // 8)
+            data = b''.join(b'\x01' + self.offsets[num].to_bytes(width, 'big') + b'\x00'
+                            for _, nums in sections for num in nums)
+            self.write_obj(xref_ref, dict(trailer, Type='XRef', Size=self.next_num, W=[1, width, 1],
+                                          Index=[v for start, nums in sections for v in (start, len(nums))],
+                                          Filter='FlateDecode'), stream=zlib.compress(data))
+        else:
+            xref_pos = self.pos
+            lines = [b'xref\n']
+            for start, nums in self._xref_sections():
+                lines.append(b'%d %d\n' % (start, len(nums)))
+                lines.extend(b'%010d 00000 n \n' % self.offsets[num] for num in nums)
+            self._write(b''.join(lines))
+            self._write(b'trailer\n' + pdf_serialize(dict(trailer, Size=self.next_num)))
+        self._write(b'\nstartxref\n%d\n%%%%EOF\n' % xref_pos)
+    
+    # 把本次写出的对象编号分成连续的xref子段：[(起始编号, [编号...]), ...]
+    def _xref_sections(self):
+        sections = []
+        for num in sorted(self.offsets):
+            if sections and sections[-1][1][-1] == num - 1:
+                sections[-1][1].append(num)
+            else:
+                sections.append((num, [num]))
+        return sections
+
+# 向已有的PDF追加章节（增量更新）：新页面、书签和xref写在文件末尾，原有内容一个字节都不重写，
+# 因此追加一个章节的开销只与该章节的大小有关，与原PDF的大小无关
+# sources 可以是PDF文件、图片文件夹或ZIP文件；图片会先用 images_to_pdf 转换成临时PDF，再像 merge_pdfs 一样复制页面
+# 每个章节生成一个以文件名命名的书签；失败或取消时把文件截断回原来的长度
+# stats 记录图片转换（convert）、页面复制（copy）和写入页面树（write）的耗时，写出的字节数只计追加的部分
+# 增量更新后的文件不再是线性化的：convert_options 中 linearize=True 时，追加完成后重新线性化整个文件（需要重写全文件）
+def append_to_pdf(pdf_path, sources, progress_callback=None, convert_options=None, cancel_event=None,
+                  stats=NO_STATS):
+    try:
+        from PyPDF2 import PdfReader
+        
+        convert_options = dict(convert_options or {})
+        linearize = convert_options.pop('linearize', False)
+        original_size = os.path.getsize(pdf_path)
+        total_files = len(sources)
+        stream_index = {} if convert_options.get('dedupe', True) else None
+        with open(pdf_path, 'r+b') as fp, tempfile.TemporaryDirectory() as temp_dir:
+            with open(pdf_path, 'rb') as src:
+                writer = PdfAppendWriter(fp, PdfReader(src))
+            try:
+                for i, source in enumerate(sources):
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise ConversionCancelled()
+                    if progress_callback:
+                        progress = (i / total_files) * 90  # 保留最后10%用于写入页面树和xref
+                        progress_callback(progress, f"正在追加章节: {i+1}/{total_files}")
+                    
+                    pdf = source
+                    if not source.lower().endswith('.pdf'):
+                        pdf = os.path.join(temp_dir, f"{i}.pdf")
+                        with stats.stage('convert'):
+                            ok = images_to_pdf(source, pdf, cancel_event=cancel_event, **convert_options)
+                        if not ok:
+                            if cancel_event is not None and cancel_event.is_set():
+                                raise ConversionCancelled()
+                            raise ValueError(f"没有找到图片或转换失败: {os.path.basename(source)}")
+                    with stats.stage('copy'):
+                        pages = copy_pdf_into(writer, pdf,
+                                              bookmark=os.path.splitext(os.path.basename(source.rstrip('/\\')))[0],
+                                              stream_index=stream_index, junk_hashes=convert_options.get('junk_hashes'))
+                    stats.add('pages', pages)
+                    stats.add('bytes_in', os.path.getsize(pdf))
+                
+                if progress_callback:
+                    progress_callback(90, "正在写入更新后的页面树...")
+                
+                with stats.stage('write'):
+                    writer.close()
+                    fp.flush()
+                    os.fsync(fp.fileno())
+                stats.add('bytes_out', fp.tell() - original_size)
+            except BaseException:
+                fp.truncate(original_size)
+                raise
+        
+        if linearize:
+            # 线性化失败时把文件截断回原来的长度，不留下追加了章节但未线性化的文件
+            try:
+                _linearize_output(linearize, progress_callback, stats)(pdf_path)
+            except BaseException:
+                os.truncate(pdf_path, original_size)
+                raise
+        
+        if progress_callback:
+            progress_callback(100, f"章节追加成功: {os.path.basename(pdf_path)}")
+        
+        print(f"Chapters appended successfully: {pdf_path}")
+        return True
+    except ConversionCancelled:
+        if progress_callback:
+            progress_callback(100, "已取消")
+        return False
+    except Exception as e:
+        if progress_callback:
+            progress_callback(100, f"追加失败: {str(e)}")
+        
+        print(f"Error appending to PDF: {e}")
+        return False
+
+# 读取物理内存总量（字节），无法获取时返回None
+def physical_memory():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+# 批量模式的默认内存预算
+def default_memory_budget():
+    if BATCH_MEMORY_BUDGET is not None:
+        return BATCH_MEMORY_BUDGET
+    total = physical_memory()
+    return total // 2 if total else None
+
+# 估算解码一页图片时的内存（字节）：预扫描读到了尺寸时按像素数计算，否则按文件大小估算
+def estimate_page_memory(page):
+    if page.width and page.height:
+        return page.width * page.height * DECODED_BYTES_PER_PIXEL + page.size
+    return page.size * DECODE_EXPANSION
+
+# 根据预扫描索引估算单个转换任务的峰值内存（字节）
+# 流式写入时每个页面线程同时只解码一页，已编码但尚未写出的页面最多 page_workers * PAGE_QUEUE_DEPTH_PER_WORKER 个，
+# 所以按最大的一页估算，与总页数无关
+def estimate_job_memory(info, page_workers=1):
+    pages = info.pages if info else ()
+    largest_decode = max((estimate_page_memory(page) for page in pages), default=0)
+    largest_file = max((page.size for page in pages), default=0)
+    return WORKER_BASE_MEMORY + page_workers * (largest_decode + PAGE_QUEUE_DEPTH_PER_WORKER * largest_file)
+
+# 在内存限额 limit（字节）以内选择尽量多的页面线程，最多 max_workers 个；
+# 一个线程也超出限额的任务（如超长条漫）只用一个线程，即低内存的逐页流式路径
+def choose_page_workers(info, max_workers, limit):
+    if limit:
+        for page_workers in range(max_workers, 1, -1):
+            if estimate_job_memory(info, page_workers) <= limit:
+                return page_workers
+        return 1
+    return max_workers
+
+# 工作进程中用于回传进度的队列和取消事件，由 _init_batch_worker 设置
+_worker_progress_queue = None
+_worker_cancel_event = None
+
+def _init_batch_worker(progress_queue, cancel_event):
+    global _worker_progress_queue, _worker_cancel_event
+    _worker_progress_queue = progress_queue
+    _worker_cancel_event = cancel_event
+    # Ctrl+C 由主进程统一处理（通过取消事件通知工作进程），工作进程自身忽略它
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # 主进程被强制结束（如 kill -9）时工作进程收不到任何通知，发现父进程变化后自行退出，不留下孤儿进程；
+    # 父进程号取启动时记录的值，主进程在工作进程启动期间就已退出时也能发现
+    parent = multiprocessing.parent_process().pid
+    
+    def watch_parent():
+        while os.getppid() == parent:
+            time.sleep(1)
+        os._exit(1)
+    
+    threading.Thread(target=watch_parent, daemon=True).start()
+
+# 转换一个章节并返回 (是否成功, 运行报告)
+def convert_job(source, output_pdf, **kwargs):
+    stats = RunStats(kind='job', source=source, output=output_pdf)
+    ok = images_to_pdf(source, output_pdf, stats=stats, **kwargs)
+    return ok, stats.report(ok=ok)
+
+# 在工作进程中转换一个章节，进度按整数百分比节流后送回主进程；返回 (是否成功, 运行报告)
+def _run_batch_job(index, source, output_pdf, page_workers, convert_options):
+    last_percent = [-1]
+    
+    def report(p, s):
+        if int(p) != last_percent[0]:
+            last_percent[0] = int(p)
+            _worker_progress_queue.put((index, p, s))
+    
+    return convert_job(source, output_pdf, progress_callback=report, page_workers=page_workers,
+                       cancel_event=_worker_cancel_event, **convert_options)
+
+# 批量转换多个章节，jobs 为 (源文件夹或ZIP, 输出PDF) 列表，返回 (成功数, 失败数)
+# convert_options 是传给 images_to_pdf 的转换参数（如 jpeg_passthrough、max_size）
+# 多个章节在独立进程中并行转换；在内存预算允许的范围内才提交新任务，每个任务的内存按预扫描读到的图片尺寸估算，
+# 见 estimate_job_memory；只有一个进程时同样按预算限制页面线程数
+# 每个任务结束后（在调用线程中）调用 on_job_done(任务序号, 是否成功, 运行报告)，运行报告见 RunStats.report
+# cancel_event 被设置后不再开始新任务，正在运行的任务在页面之间停止；被取消的任务既不算成功也不算失败
+# infos 是与 jobs 对应的预扫描索引（SourceInfo，带图片尺寸时估算更准确），为None时在这里扫描；总进度按各章节的图片字节数加权，
+# 并行时先提交最大的章节，避免最后只剩一个大章节单独运行
+def run_batch_jobs(jobs, progress_callback=None, workers=None, memory_budget=None, on_job_done=None,
+                   cancel_event=None, convert_options=None, infos=None):
+    convert_options = convert_options or {}
+    total = len(jobs)
+    workers = max(1, min(workers or BATCH_WORKERS or os.cpu_count() or 1, total))
+    success_count = 0
+    fail_count = 0
+    if infos is None:
+        infos = [scan_source(source, dimensions=True) for source, _ in jobs]
+    if memory_budget is None:
+        memory_budget = default_memory_budget()
+    weights = [max(info.total_bytes if info else 0, 1) for info in infos]
+    total_weight = sum(weights)
+    page_counts = [len(info.pages) if info else 0 for info in infos]
+    progress = [0.0] * total
+    
+    # 把各章节的进度（0-100）汇总为整体进度（按字节数加权），以及估算的已处理页数和字节数
+    def report_overall(status):
+        if progress_callback:
+            bytes_done = sum(p * w for p, w in zip(progress, weights)) / 100
+            report_progress(progress_callback, bytes_done / total_weight * 100, status,
+                            pages_done=round(sum(p * n for p, n in zip(progress, page_counts)) / 100),
+                            pages_total=sum(page_counts), bytes_done=bytes_done, bytes_total=total_weight)
+    
+    if workers == 1:
+        for i, (source, output_pdf) in enumerate(jobs):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            
+            # 为当前任务创建一个进度回调函数，把它的0-100%计入整体进度
+            def job_progress_callback(p, s):
+                progress[i] = p
+                report_overall(f"[{i+1}/{total}] {s}")
+            
+            page_workers = choose_page_workers(infos[i], PAGE_WORKERS or os.cpu_count() or 1, memory_budget)
+            ok, report = convert_job(source, output_pdf, progress_callback=job_progress_callback,
+                                     page_workers=page_workers, cancel_event=cancel_event, **convert_options)
+            if not ok and cancel_event is not None and cancel_event.is_set():
+                break
+            if ok:
+                success_count += 1
+            else:
+                fail_count += 1
+            if on_job_done:
+                on_job_done(i, ok, report)
+            progress[i] = 100
+        return (success_count, fail_count)
+    
+    # 多个章节并行时把CPU核心平分给各个进程，避免页面线程过多；每个章节的页面线程数再受内存预算的平均份额限制，
+    # 页数多但每页很小的章节照常并行，单页很大的章节减少线程，一个线程也超出预算的章节只能在没有其他任务时单独运行
+    share = memory_budget // workers if memory_budget else None
+    page_workers = [choose_page_workers(info, max(1, (os.cpu_count() or 1) // workers), share) for info in infos]
+    estimates = [estimate_job_memory(info, n) for info, n in zip(infos, page_workers)]
+    finished = set()
+    status = ""
+    pending = deque(sorted(range(total), key=lambda index: -weights[index]))
+    running = {}
+    in_flight = 0
+    
+    # 统一使用spawn启动工作进程：批量任务运行在GUI的后台线程中，fork带线程的进程并不安全
+    ctx = multiprocessing.get_context('spawn')
+    progress_queue = ctx.Queue()
+    worker_cancel_event = ctx.Event()
+    cancelled = False
+    # 工作进程意外退出（如被OOM killer杀掉）时进程池会整体失效：正在运行的章节都算失败（不写入断点日志，
+    # 可以用 --resume 重新转换），然后重新创建进程池继续处理剩余的章节
+    while pending or running:
+        broken = False
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_batch_worker,
+                                 initargs=(progress_queue, worker_cancel_event)) as pool:
+            while (pending and not broken) or running:
+                if not cancelled and cancel_event is not None and cancel_event.is_set():
+                    cancelled = True
+                    worker_cancel_event.set()
+                    pending.clear()
+                    status = "正在取消，等待正在处理的章节停止..."
+                
+                # 在进程数和内存预算允许的范围内提交任务：按从大到小的顺序提交第一个放得下的章节，
+                # 最大的章节暂时放不下时先用较小的章节填满预算；没有任务在运行时至少提交一个，保证能继续推进
+                while len(running) < workers and not broken:
+                    index = next((index for index in pending if not running or not memory_budget
+                                  or in_flight + estimates[index] <= memory_budget), None)
+                    if index is None:
+                        break
+                    try:
+                        future = pool.submit(_run_batch_job, index, *jobs[index], page_workers[index],
+                                             convert_options)
+                    except BrokenProcessPool:
+                        broken = True
+                        break
+                    pending.remove(index)
+                    in_flight += estimates[index]
+                    if memory_budget and estimates[index] > memory_budget:
+                        print(f"Low-memory mode for {jobs[index][0]}: estimated {estimates[index] / 2**20:.0f} MB "
+                              f"exceeds the {memory_budget / 2**20:.0f} MB budget, running it alone with one page thread")
+                    running[future] = index
+                
+                done, _ = wait(running, timeout=0.1, return_when=FIRST_COMPLETED)
+                
+                while True:
+                    try:
+                        index, p, s = progress_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if index not in finished:
+                        progress[index] = p
+                        status = f"[{index+1}/{total}] {s}"
+                
+                for future in done:
+                    index = running.pop(future)
+                    in_flight -= estimates[index]
+                    finished.add(index)
+                    progress[index] = 100
+                    try:
+                        ok, report = future.result()
+                    except Exception as e:
+                        print(f"Error converting {jobs[index][0]}: {e}")
+                        broken = broken or isinstance(e, BrokenProcessPool)
+                        ok, report = False, {'source': jobs[index][0], 'output': jobs[index][1], 'ok': False,
+                                             'error': str(e)}
+                    if not ok and cancelled:
+                        continue
+                    if ok:
+                        success_count += 1
+                    else:
+                        fail_count += 1
+                    if on_job_done:
+                        on_job_done(index, ok, report)
+                
+                report_overall(status or f"正在处理 {len(running)} 个任务...")
+        
+        if broken and pending:
+            print(f"A worker process died unexpectedly, restarting the process pool for {len(pending)} remaining jobs")
+    
+    return (success_count, fail_count)
+
+# 读取输出文件夹中的增量清单：{源的绝对路径: {"fingerprint": ..., "output": ...}}
+def load_manifest(output_folder):
+    try:
+        with open(os.path.join(output_folder, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+# 保存增量清单：先写临时文件再替换，中途崩溃也不会留下损坏的清单
+def save_manifest(output_folder, manifest):
+    path = os.path.join(output_folder, MANIFEST_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(path + '.tmp', path)
+
+# 读取断点日志，返回 {源的绝对路径: 记录}；日志末尾写了一半的行会被忽略
+def load_journal(output_folder):
+    done = {}
+    try:
+        with open(os.path.join(output_folder, JOURNAL_NAME), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                done[entry['source']] = entry
+    except OSError:
+        pass
+    return done
+
+# 向断点日志追加一条已完成记录，并立即刷到磁盘
+def append_journal(output_folder, entry):
+    with open(os.path.join(output_folder, JOURNAL_NAME), 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+# 删除断点日志
+def clear_journal(output_folder):
+    with contextlib.suppress(OSError):
+        os.remove(os.path.join(output_folder, JOURNAL_NAME))
+
+# 输出文件夹中是否有未完成的批量任务可以继续
+def has_unfinished_batch(output_folder):
+    return os.path.isfile(os.path.join(output_folder, JOURNAL_NAME))
+
+# 清单或日志中的记录是否说明该章节的PDF已经是最新的
+def _is_up_to_date(entry, fingerprint, output_pdf):
+    return bool(fingerprint and entry and entry.get('fingerprint') == fingerprint
+                and entry.get('output') == os.path.basename(output_pdf) and os.path.isfile(output_pdf))
+
+# 章节的指纹：预扫描指纹加上转换参数，增量清单和断点日志用它判断章节是否需要重新转换；无法读取的源返回None
+def job_fingerprint(info, convert_options=None):
+    if not info:
+        return None
+    options_key = json.dumps(convert_options or {}, sort_keys=True)
+    return hashlib.sha1((info.fingerprint + options_key).encode('utf-8')).hexdigest()
+
+# 批量规划中的一个章节：action 为 'convert'（需要转换）、'unchanged'（增量模式下未变化）或 'done'（断点日志中已完成）
+PlannedJob = namedtuple('PlannedJob', ['source', 'output_pdf', 'info', 'fingerprint', 'action'])
+
+# 规划批量任务：一次预扫描所有源（目录项和ZIP中央目录），计算指纹并决定每个章节是否需要转换，不写任何文件
+# 转换参数也计入指纹，参数变化后的章节会重新转换；dimensions=True 时再为需要转换的章节从文件头读取每页的尺寸，
+# 未变化和已完成的章节不打开任何图片
+def plan_batch(jobs, output_folder, incremental=False, resume=False, convert_options=None, dimensions=False):
+    manifest = load_manifest(output_folder) if incremental else {}
+    journal = load_journal(output_folder) if resume else {}
+    plan = []
+    for source, output_pdf in jobs:
+        key = os.path.abspath(source)
+        info = scan_source(source)
+        fingerprint = job_fingerprint(info, convert_options)
+        if incremental and _is_up_to_date(manifest.get(key), fingerprint, output_pdf):
+            action = 'unchanged'
+        elif _is_up_to_date(journal.get(key), fingerprint, output_pdf):
+            action = 'done'
+        else:
+            action = 'convert'
+            if dimensions and info:
+                info = scan_source(source, dimensions=True) or info
+        plan.append(PlannedJob(source, output_pdf, info, fingerprint, action))
+    return plan
+
+# 把批量规划整理成可读的报告（--dry-run 使用）：需要转换的章节按调度顺序（从大到小）列出，然后是跳过的章节
+def format_plan_report(plan):
+    actions = {'convert': "转换", 'unchanged': "跳过（未变化）", 'done': "跳过（已完成）"}
+    todo = sorted((item for item in plan if item.action == 'convert'),
+                  key=lambda item: -(item.info.total_bytes if item.info else 0))
+    lines = [f"{'页数':>6} {'大小MB':>9} {'最大尺寸':>12} {'估计内存MB':>10}  操作  章节"]
+    for item in todo + [item for item in plan if item.action != 'convert']:
+        name = os.path.basename(item.source.rstrip('/\\'))
+        if not item.info:
+            lines.append(f"{'-':>6} {'-':>9} {'-':>12} {'-':>10}  无法读取  {name}")
+            continue
+        sized = [page for page in item.info.pages if page.width]
+        largest = max(sized, key=lambda page: page.width * page.height, default=None)
+        dims = f"{largest.width}x{largest.height}" if largest else "-"
+        lines.append(f"{len(item.info.pages):>6} {item.info.total_bytes / 2**20:>9.1f} {dims:>12} "
+                     f"{estimate_job_memory(item.info) / 2**20:>10.0f}  {actions[item.action]}  {name}")
+    todo_pages = sum(len(item.info.pages) for item in todo if item.info)
+    todo_bytes = sum(item.info.total_bytes for item in todo if item.info)
+    lines.append(f"共 {len(plan)} 个章节：需要转换 {len(todo)} 个（{todo_pages} 页, {todo_bytes / 2**20:.1f} MB），"
+                 f"跳过 {len(plan) - len(todo)} 个")
+    return "\n".join(lines)
+
+# 批量转换的公共流程：可选的增量跳过、断点续传、并行转换、汇总进度，返回 (成功数, 失败数)
+# incremental=True 时，指纹与清单一致且PDF仍然存在的章节直接跳过，计入成功数
+# resume=True 时，跳过断点日志中记录为已完成的章节；否则从头开始并清空旧日志
+# 所有章节都成功完成后删除断点日志；被取消或有失败时保留，下次可以继续
+# report_path 不为None时把批量运行报告写成JSON：汇总的阶段耗时、页数、字节数和峰值内存，以及每个章节的运行报告
+# cluster 不为None时不在本机转换，而是作为协调器把章节分发给工作节点，内容是传给 run_cluster_jobs 的参数
+# （address、lease_seconds、max_attempts、token）；增量清单、断点日志和运行报告仍由本机写入
+def convert_batch(jobs, output_folder, progress_callback=None, workers=None, memory_budget=None, incremental=False,
+                  resume=False, cancel_event=None, convert_options=None, report_path=None, cluster=None):
+    stats = RunStats(kind='batch', output_folder=output_folder)
+    job_reports = []
+    with stats.stage('plan'):
+        plan = plan_batch(jobs, output_folder, incremental, resume, convert_options, dimensions=True)
+    manifest = load_manifest(output_folder) if incremental else None
+    if not resume:
+        clear_journal(output_folder)
+    
+    # 清理上次崩溃时留下的临时文件
+    for _, output_pdf in jobs:
+        for stale in stale_part_files(output_pdf):
+            with contextlib.suppress(OSError):
+                os.remove(stale)
+    
+    skipped = sum(item.action == 'unchanged' for item in plan)
+    resumed = sum(item.action == 'done' for item in plan)
+    todo = [item for item in plan if item.action == 'convert']
+    
+    if progress_callback and (skipped or resumed):
+        progress_callback(0, f"跳过 {skipped} 个未变化的章节, {resumed} 个上次已完成的章节")
+    
+    # 每完成一个章节就写断点日志并更新清单，中途中断时已完成的章节下次可以跳过
+    def on_job_done(index, ok, report):
+        stats.add_report(report)
+        job_reports.append(report)
+        item = todo[index]
+        key = os.path.abspath(item.source)
+        entry = {'fingerprint': item.fingerprint, 'output': os.path.basename(item.output_pdf)}
+        if ok:
+            append_journal(output_folder, dict(entry, source=key))
+        if incremental:
+            if ok and item.fingerprint:
+                manifest[key] = entry
+            else:
+                manifest.pop(key, None)
+            save_manifest(output_folder, manifest)
+    
+    success_count, fail_count = 0, 0
+    if todo and cluster:
+        success_count, fail_count = run_cluster_jobs([(item.source, item.output_pdf) for item in todo],
+                                                     progress_callback, on_job_done, cancel_event, convert_options,
+                                                     [item.info for item in todo], **cluster)
+    elif todo:
+        success_count, fail_count = run_batch_jobs([(item.source, item.output_pdf) for item in todo],
+                                                   progress_callback, workers, memory_budget, on_job_done,
+                                                   cancel_event, convert_options, [item.info for item in todo])
+    
+    cancelled = cancel_event is not None and cancel_event.is_set()
+    if not cancelled and not fail_count:
+        clear_journal(output_folder)
+    
+    if report_path:
+        # cpu_seconds 只是主进程的CPU时间，各章节（工作进程）的合计另外记录；工作进程的峰值内存在进程池关闭后才能读到
+        job_cpu_seconds = sum(report.get('cpu_seconds', 0) for report in job_reports)
+        write_run_report(report_path, stats.report(succeeded=success_count, failed=fail_count, skipped=skipped,
+                                                   resumed=resumed, cancelled=cancelled,
+                                                   job_cpu_seconds=round(job_cpu_seconds, 6),
+                                                   worker_peak_rss_mb=peak_rss_mb(children=True),
+                                                   jobs=job_reports))
+    
+    if progress_callback:
+        skipped_text = f"（其中 {skipped + resumed} 个已跳过）" if skipped + resumed else ""
+        cancelled_text = "，已取消，剩余章节可以下次继续" if cancelled else ""
+        progress_callback(100, f"处理完成: 成功 {success_count + skipped + resumed} 个{skipped_text}, "
+                               f"失败 {fail_count} 个{cancelled_text}")
+    
+    return (success_count + skipped + resumed, fail_count)
+
+# ZIP批量模式的任务列表：每个ZIP在输出文件夹中生成一个同名PDF
+def zip_jobs(zip_files, output_folder):
+    # 输出文件名取ZIP文件名（不含路径和扩展名）
+    return [(zip_file, os.path.join(output_folder, f"{os.path.splitext(os.path.basename(zip_file))[0]}.pdf"))
+            for zip_file in zip_files]
+
+# 批量模式的任务列表：主文件夹下的每个子文件夹在输出文件夹中生成一个同名PDF
+# 用一次 os.scandir 列出子文件夹；输出文件夹本身也在主文件夹下，不能当成章节处理
+def folder_jobs(root_folder, output_folder):
+    with os.scandir(root_folder) as it:
+        subdirs = [entry for entry in it if entry.is_dir()
+                   and os.path.abspath(entry.path) != os.path.abspath(output_folder)]
+    return [(entry.path, os.path.join(output_folder, f"{entry.name}.pdf")) for entry in subdirs]
+
+# 批量转换多个ZIP文件，每个ZIP在输出文件夹中生成一个同名PDF
+def process_all_zips(zip_files, output_folder, progress_callback=None, workers=None, memory_budget=None,
+                     incremental=False, resume=False, cancel_event=None, convert_options=None, report_path=None,
+                     cluster=None):
+    jobs = zip_jobs(zip_files, output_folder)
+    
+    if not jobs:
+        if progress_callback:
+            progress_callback(100, "没有找到ZIP文件")
+        return (0, 0)
+    
+    return convert_batch(jobs, output_folder, progress_callback, workers, memory_budget, incremental, resume,
+                         cancel_event, convert_options, report_path, cluster)
+
+# 批量转换主文件夹下的每个子文件夹，每个子文件夹在输出文件夹中生成一个同名PDF
+def process_all_folders(root_folder, output_folder, progress_callback=None, workers=None, memory_budget=None,
+                        incremental=False, resume=False, cancel_event=None, convert_options=None, report_path=None,
+                        cluster=None):
+    jobs = folder_jobs(root_folder, output_folder)
+    
+    if not jobs:
+        if progress_callback:
+            progress_callback(100, "没有找到子文件夹")
+        return (0, 0)
+    
+    return convert_batch(jobs, output_folder, progress_callback, workers, memory_budget, incremental, resume,
+                         cancel_event, convert_options, report_path, cluster)
+
+# 读取监视模式的持久化队列，返回队列项列表（按入队顺序）
+def load_queue(output_folder):
+    try:
+        with open(os.path.join(output_folder, QUEUE_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+# 保存监视模式的持久化队列：先写临时文件再替换
+def save_queue(output_folder, queue):
+    path = os.path.join(output_folder, QUEUE_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(queue, f, ensure_ascii=False, indent=1)
+    os.replace(path + '.tmp', path)
+
+# 列出输入文件夹中可以转换的章节：子文件夹和ZIP文件，返回 (路径, 输出PDF文件名) 列表
+# 隐藏的文件夹和输出文件夹本身不算章节
+def watch_candidates(input_folder, output_folder):
+    candidates = []
+    with os.scandir(input_folder) as it:
+        for entry in it:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir():
+                if os.path.abspath(entry.path) != os.path.abspath(output_folder):
+                    candidates.append((entry.path, f"{entry.name}.pdf"))
+            elif entry.name.lower().endswith('.zip'):
+                candidates.append((entry.path, f"{os.path.splitext(entry.name)[0]}.pdf"))
+    return candidates
+
+# 判断章节是否还在写入用的签名：ZIP取大小和修改时间，文件夹取预扫描指纹（每张图片的名称、大小和修改时间）
+# 签名在一段时间内不变才认为章节已经写完；空文件夹和无法读取的源返回None
+def source_signature(path):
+    try:
+        if os.path.isdir(path):
+            info = scan_source(path)
+            return info.fingerprint if info and info.pages else None
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        return None
+
+# 计算一组耗时的中位数、95分位数和最大值（秒）
+def latency_summary(values):
+    values = sorted(values)
+    if not values:
+        return None
+    return {'p50': round(values[len(values) // 2], 3),
+            'p95': round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+            'max': round(values[-1], 3)}
+
+# 监视模式：持续扫描输入文件夹，新的章节（子文件夹或ZIP）写完后自动转换为PDF
+# 1. 每 interval 秒扫描一次，章节的签名保持 settle 秒不变才认为已经写完，避免转换复制了一半的文件
+# 2. 写完的章节先写入输出文件夹中的持久化队列，再交给工作进程池转换；退出时未完成的章节留在队列中，下次启动时继续
+# 3. 转换结果记录在增量清单中，已转换且没有变化的章节不会重复转换；章节内容变化后重新转换
+# 4. 并行数和内存预算与批量模式相同；collect_pdf 不为None时，每个转换完成的章节还会追加到这个合集PDF的末尾
+# 5. metrics_path 不为None时，持续把队列深度、正在运行的任务和延迟统计写入该JSON文件
+# cancel_event 被设置后不再开始新任务，等待正在运行的任务停止后返回
+class WatchDaemon:
+    def __init__(self, input_folders, output_folder, workers=None, memory_budget=None, convert_options=None,
+                 interval=WATCH_INTERVAL, settle=WATCH_SETTLE_SECONDS, collect_pdf=None, metrics_path=None,
+                 cancel_event=None, log=None):
+        self.input_folders = input_folders
+        self.output_folder = output_folder
+        self.workers = max(1, workers or BATCH_WORKERS or os.cpu_count() or 1)
+        self.memory_budget = memory_budget if memory_budget is not None else default_memory_budget()
+        self.convert_options = convert_options or {}
+        self.interval = interval
+        self.settle = settle
+        self.collect_pdf = collect_pdf
+        self.metrics_path = metrics_path
+        self.cancel_event = cancel_event or threading.Event()
+        self.log = log or (lambda message: None)
+        self.manifest = load_manifest(output_folder)
+        self.queue = load_queue(output_folder)
+        self.watching = {}    # 源 -> [签名, 首次发现时间, 最近变化时间, 是否已处理]
+        self.estimates = {}   # 源 -> (页面线程数, 估计内存)
+        self.running = {}     # Future -> (队列项, 开始时间, 估计内存, 任务序号)
+        self.progress = {}    # 任务序号 -> 百分比
+        self.job_count = 0
+        self.completed = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=WATCH_METRICS_WINDOW)  # (到达到完成, 排队等待, 转换耗时)
+        self.started = time.time()
+        self.broken = False
+
+    # 扫描输入文件夹：记录新出现和仍在变化的章节，把已经稳定的章节加入队列
+    def scan(self):
+        now = time.time()
+        queued = {entry['source'] for entry in self.queue}
+        present = set()
+        for folder in self.input_folders:
+            try:
+                candidates = watch_candidates(folder, self.output_folder)
+            except OSError:
+                continue
+            for path, output_name in candidates:
+                source = os.path.abspath(path)
+                present.add(source)
+                if source in queued:
+                    continue
+                signature = source_signature(source)
+                state = self.watching.get(source)
+                if state is None or state[0] != signature:
+                    self.watching[source] = [signature, state[1] if state else now, now, False]
+                elif not state[3] and signature is not None and now - state[2] >= self.settle:
+                    state[3] = True
+                    self.enqueue(source, os.path.join(self.output_folder, output_name), state[1])
+        for source in list(self.watching):
+            if source not in present:
+                del self.watching[source]
+
+    def enqueue(self, source, output_pdf, seen):
+        info = scan_source(source)
+        # 损坏的ZIP（例如复制中途停顿了一段时间）和没有图片的文件夹暂不处理，内容变化后再检查
+        if not info or not info.pages:
+            return
+        fingerprint = job_fingerprint(info, self.convert_options)
+        if _is_up_to_date(self.manifest.get(source), fingerprint, output_pdf):
+            return
+        self.queue.append({'source': source, 'output': output_pdf, 'fingerprint': fingerprint,
+                           'seen': seen, 'queued': time.time()})
+        save_queue(self.output_folder, self.queue)
+        self.log(f"已加入队列: {os.path.basename(source)}（等待 {len(self.queue) - len(self.running)} 个）")
+
+    # 按入队顺序提交放得下的章节，内存预算的计算与 run_batch_jobs 相同
+    def submit(self, pool):
+        busy = {entry['source'] for entry, _, _, _ in self.running.values()}
+        in_flight = sum(estimate for _, _, estimate, _ in self.running.values())
+        share = self.memory_budget // self.workers if self.memory_budget else None
+        for entry in self.queue:
+            if len(self.running) >= self.workers:
+                break
+            if entry['source'] in busy:
+                continue
+            if entry['source'] not in self.estimates:
+                info = scan_source(entry['source'], dimensions=True)
+                page_workers = choose_page_workers(info, max(1, (os.cpu_count() or 1) // self.workers), share)
+                self.estimates[entry['source']] = (page_workers, estimate_job_memory(info, page_workers))
+            page_workers, estimate = self.estimates[entry['source']]
+            if self.running and self.memory_budget and in_flight + estimate > self.memory_budget:
+                continue
+            try:
+                future = pool.submit(_run_batch_job, self.job_count + 1, entry['source'], entry['output'],
+                                     page_workers, self.convert_options)
+            except BrokenProcessPool:
+                self.broken = True
+                return
+            self.job_count += 1
+            self.running[future] = (entry, time.time(), estimate, self.job_count)
+            busy.add(entry['source'])
+            in_flight += estimate
+
+    def finish(self, future):
+        entry, started, _, index = self.running.pop(future)
+        self.progress.pop(index, None)
+        self.estimates.pop(entry['source'], None)
+        name = os.path.basename(entry['source'])
+        try:
+            ok, _ = future.result()
+        except BrokenProcessPool as e:
+            # 进程池失效时正在转换的章节都留在队列中重试，尝试次数随队列一起保存；次数用完才算失败
+            self.broken = True
+            entry['attempts'] = entry.get('attempts', 0) + 1
+            if entry['attempts'] < WATCH_MAX_ATTEMPTS:
+                self.log(f"工作进程意外退出，重新排队: {name}（已尝试 {entry['attempts']} 次）")
+                save_queue(self.output_folder, self.queue)
+                return
+            print(f"Error converting {entry['source']}: {e}")
+            ok = False
+        except Exception as e:
+            print(f"Error converting {entry['source']}: {e}")
+            ok = False
+        # 因退出而中断的章节留在队列中，下次启动时继续
+        if not ok and self.cancel_event.is_set():
+            return
+        self.queue.remove(entry)
+        now = time.time()
+        if ok:
+            self.completed += 1
+            self.manifest[entry['source']] = {'fingerprint': entry['fingerprint'],
+                                              'output': os.path.basename(entry['output'])}
+            self.latencies.append((now - entry['seen'], started - entry['queued'], now - started))
+            if self.collect_pdf:
+                self.collect(entry['output'])
+            self.log(f"完成: {name}，转换 {now - started:.1f} 秒，从出现到完成 {now - entry['seen']:.1f} 秒")
+        else:
+            self.failed += 1
+            self.manifest.pop(entry['source'], None)
+            self.log(f"失败: {name}")
+        save_manifest(self.output_folder, self.manifest)
+        save_queue(self.output_folder, self.queue)
+
+    # 把转换好的章节追加到合集PDF；合集还不存在时用第一个章节创建
+    # 合集只做增量追加，不重新线性化：每追加一章就重写整个合集的代价太大
+    def collect(self, pdf):
+        if os.path.exists(self.collect_pdf):
+            options = {key: value for key, value in self.convert_options.items() if key != 'linearize'}
+            append_to_pdf(self.collect_pdf, [pdf], convert_options=options)
+        else:
+            merge_pdfs([pdf], self.collect_pdf, dedupe=self.convert_options.get('dedupe', True),
+                       junk_hashes=self.convert_options.get('junk_hashes'))
+
+    def metrics(self):
+        now = time.time()
+        return {
+            'time': round(now, 3),
+            'uptime_seconds': round(now - self.started, 1),
+            'queue_depth': len(self.queue) - len(self.running),
+            'running': len(self.running),
+            'settling': sum(not state[3] and state[0] is not None for state in self.watching.values()),
+            'completed': self.completed,
+            'failed': self.failed,
+            'latency_seconds': latency_summary(latency for latency, _, _ in self.latencies),
+            'queue_wait_seconds': latency_summary(wait for _, wait, _ in self.latencies),
+            'convert_seconds': latency_summary(convert for _, _, convert in self.latencies),
+            'running_jobs': [{'source': entry['source'], 'percent': round(self.progress.get(index, 0), 1),
+                              'seconds': round(now - started, 1)}
+                             for entry, started, _, index in self.running.values()],
+        }
+
+    def run(self):
+        os.makedirs(self.output_folder, exist_ok=True)
+        if self.queue:
+            self.log(f"继续上次未完成的 {len(self.queue)} 个章节")
+        self.log(f"正在监视: {', '.join(self.input_folders)}")
+        # 与批量模式相同，工作进程统一用spawn启动，通过取消事件停止
+        ctx = multiprocessing.get_context('spawn')
+        progress_queue = ctx.Queue()
+        worker_cancel_event = ctx.Event()
+        next_scan = 0.0
+        # 进程池失效（工作进程意外退出）后等正在运行的章节都结束，再重新创建进程池继续监视
+        while not self.cancel_event.is_set() or self.running:
+            self.broken = False
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx, initializer=_init_batch_worker,
+                                     initargs=(progress_queue, worker_cancel_event)) as pool:
+                while True:
+                    if self.cancel_event.is_set():
+                        worker_cancel_event.set()
+                        if not self.running:
+                            break
+                    else:
+                        if time.monotonic() >= next_scan:
+                            self.scan()
+                            next_scan = time.monotonic() + self.interval
+                        if not self.broken:
+                            self.submit(pool)
+                        elif not self.running:
+                            break
+                    
+                    timeout = self.interval if self.cancel_event.is_set() else max(0.0, next_scan - time.monotonic())
+                    done = ()
+                    if self.running:
+                        done, _ = wait(self.running, timeout=timeout, return_when=FIRST_COMPLETED)
+                    else:
+                        self.cancel_event.wait(timeout)
+                    
+                    while True:
+                        try:
+                            index, p, _ = progress_queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if any(index == running_index for _, _, _, running_index in self.running.values()):
+                            self.progress[index] = p
+                    for future in done:
+                        self.finish(future)
+                    
+                    if self.metrics_path:
+                        write_run_report(self.metrics_path, self.metrics())
+            if self.broken and not self.cancel_event.is_set():
+                self.log("工作进程意外退出，重新创建进程池")
+        
+        self.log(f"已停止：完成 {self.completed} 个，失败 {self.failed} 个，队列中还有 {len(self.queue)} 个")
+
+# 解析协调器的监听地址：'端口' 或 '主机:端口'，只给出端口时只监听本机（127.0.0.1）
+def parse_address(text):
+    host, _, port = text.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+# 主机名是否只解析到回环地址；空主机名（所有网络接口）和无法解析的主机名都不算
+def is_loopback_host(host):
+    import ipaddress
+    import socket
+    
+    try:
+        return all(ipaddress.ip_address(info[4][0].split('%')[0]).is_loopback
+                   for info in socket.getaddrinfo(host, None))
+    except (OSError, ValueError):
+        return False
+
+# 运行报告中的数值（排除 bool）
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+# 分布式模式的协调器：把批量任务的章节通过HTTP分发给多台机器上的工作节点（见 ClusterWorker），
+# 各节点在共享存储上转换章节，协调器汇总进度和结果
+# 1. 节点有空闲的工作进程时申请租约（POST /lease），协调器按从大到小的顺序交给它第一个放得下的章节，与 run_batch_jobs 的调度相同
+# 2. 节点转换期间定期发送心跳（POST /heartbeat）续租并报告进度；超过 lease_seconds 没有续租的章节（节点崩溃、断网）重新排队
+# 3. 节点报告结果（POST /complete）；失败的章节同样重新排队，每个章节最多尝试 max_attempts 次，优先交给还没有失败过的节点
+#    （例如某个节点没有挂载共享存储）；已经失效的租约的结果被忽略
+# 4. GET /status 返回汇总的进度和各节点的状态
+# 源和输出以绝对路径发送，所有节点都需要把共享存储挂载在相同的路径上；
+# token 不为None时每个请求都要带上 Authorization: Bearer <token>；监听回环地址以外的地址时必须设置 token
+# 节点报告的结果先经过 verify 检查，不直接信任节点发来的输出路径和计数
+class ClusterCoordinator:
+    def __init__(self, jobs, infos=None, convert_options=None, lease_seconds=CLUSTER_LEASE_SECONDS,
+                 max_attempts=CLUSTER_MAX_ATTEMPTS, token=None):
+        if infos is None:
+            infos = [scan_source(source, dimensions=True) for source, _ in jobs]
+        self.jobs = [{'source': os.path.abspath(source), 'output': os.path.abspath(output_pdf), 'state': 'pending',
+                      'attempts': 0, 'lease': None, 'worker': None, 'expires': 0.0, 'percent': 0.0,
+                      'failed_on': set()}
+                     for source, output_pdf in jobs]
+        self.weights = [max(info.total_bytes if info else 0, 1) for info in infos]
+        self.page_counts = [len(info.pages) if info else 0 for info in infos]
+        self.estimates = [estimate_job_memory(info) for info in infos]
+        self.order = sorted(range(len(jobs)), key=lambda index: -self.weights[index])
+        self.convert_options = convert_options or {}
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.token = token
+        self.cancelled = False
+        self.leases = {}            # 租约 -> 任务序号
+        self.workers = {}           # 节点名 -> {'last_seen', 'completed', 'failed', 'stopped'}
+        self.results = queue.Queue()  # 最终结果 (任务序号, 是否成功, 运行报告)，在调用 run 的线程中处理
+        self.lock = threading.Lock()
+
+    def authorized(self, header):
+        import hmac
+        
+        if not self.token:
+            return True
+        return hmac.compare_digest((header or '').encode('utf-8'), f"Bearer {self.token}".encode('utf-8'))
+
+    def seen(self, request):
+        worker = self.workers.setdefault(str(request.get('worker')),
+                                         {'last_seen': 0.0, 'completed': 0, 'failed': 0, 'stopped': False})
+        worker['last_seen'] = time.time()
+        return worker
+
+    # 章节能否交给该节点：失败过的章节只有在其他在线的节点也都失败过时才交回同一个节点
+    def eligible(self, index, name):
+        failed_on = self.jobs[index]['failed_on']
+        if name not in failed_on:
+            return True
+        now = time.time()
+        return all(other in failed_on for other, worker in self.workers.items()
+                   if now - worker['last_seen'] <= self.lease_seconds)
+
+    # 全部章节都已完成或失败；取消后没有章节正在转换时也算结束
+    def finished(self):
+        if self.cancelled:
+            return not self.leases
+        return all(job['state'] in ('done', 'failed') for job in self.jobs)
+
+    def lease(self, request):
+        import secrets
+        
+        worker = self.seen(request)
+        if self.cancelled or self.finished():
+            worker['stopped'] = True
+            return {'job': None, 'stop': True}
+        # 节点报告的可用内存放不下任何章节时不分配；空闲的节点至少领到一个章节，保证能继续推进
+        free = request.get('memory')
+        name = str(request.get('worker'))
+        index = next((index for index in self.order if self.jobs[index]['state'] == 'pending'
+                      and (request.get('idle') or free is None or self.estimates[index] <= free)
+                      and self.eligible(index, name)), None)
+        if index is None:
+            return {'job': None, 'stop': False}
+        job = self.jobs[index]
+        job.update(state='leased', lease=secrets.token_hex(8), worker=name, percent=0.0,
+                   expires=time.monotonic() + self.lease_seconds, attempts=job['attempts'] + 1)
+        self.leases[job['lease']] = index
+        return {'job': {'lease': job['lease'], 'source': job['source'], 'output': job['output'],
+                        'attempt': job['attempts']},
+                'convert_options': self.convert_options, 'lease_seconds': self.lease_seconds, 'stop': False}
+
+    def heartbeat(self, request):
+        self.seen(request)
+        lost = []
+        for item in request.get('leases', ()):
+            index = self.leases.get(item.get('lease'))
+            if index is None:
+                lost.append(item.get('lease'))
+                continue
+            self.jobs[index]['expires'] = time.monotonic() + self.lease_seconds
+            self.jobs[index]['percent'] = float(item.get('percent', 0))
+        return {'lost': lost, 'cancel': self.cancelled}
+
+    def complete(self, request):
+        self.seen(request)
+        index = self.leases.pop(request.get('lease'), None)
+        if index is None:
+            return {'accepted': False}
+        ok, report, error = self.verify(index, request.get('ok') is True, request.get('report'), request.get('error'))
+        self.release(index, ok, report, error, request.get('interrupted') is True)
+        return {'accepted': True}
+
+    # 检查节点报告的结果，返回 (是否成功, 运行报告, 错误信息)
+    # 运行报告的源和输出总是取租出的章节，计数和各阶段耗时只保留数值；报告成功时，报告中的输出必须就是租出的章节的输出，
+    # 并且协调器在共享存储上看到的文件大小要与报告的写出字节数一致，否则按失败处理（章节会被重试）
+    def verify(self, index, ok, report, error):
+        job = self.jobs[index]
+        report = report if isinstance(report, dict) else {}
+        counters = report.get('counters') if isinstance(report.get('counters'), dict) else {}
+        stages = report.get('stages') if isinstance(report.get('stages'), dict) else {}
+        checked = {'kind': 'job', 'source': job['source'], 'output': job['output'], 'ok': ok,
+                   'counters': {name: value for name, value in counters.items() if _is_number(value)},
+                   'stages': {name: stage for name, stage in stages.items() if isinstance(stage, dict)
+                              and all(_is_number(stage.get(key)) for key in ('wall_seconds', 'cpu_seconds', 'calls'))}}
+        for key in ('wall_seconds', 'cpu_seconds', 'pages_per_second', 'peak_rss_mb'):
+            if _is_number(report.get(key)):
+                checked[key] = report[key]
+        error = str(error or report.get('error') or '') or None
+        if ok:
+            try:
+                size = os.path.getsize(job['output'])
+            except OSError:
+                size = None
+            if not isinstance(report.get('output'), str) or os.path.abspath(report['output']) != job['output']:
+                ok, error = False, f"reported output {report.get('output')!r} is not the leased output"
+            elif size is None or size != checked['counters'].get('bytes_out'):
+                ok, error = False, (f"output {job['output']} is {'missing' if size is None else f'{size} bytes'}, "
+                                    f"reported {checked['counters'].get('bytes_out')} bytes")
+        checked.update(ok=ok, error=error)
+        return ok, checked, error
+
+    # 结束一个租约：成功的章节完成；失败的章节在尝试次数用完之前重新排队
+    # 取消时或因节点停止而中断（interrupted）的章节既不算成功也不算失败，节点停止时也不计入尝试次数
+    def release(self, index, ok, report, error=None, interrupted=False):
+        job = self.jobs[index]
+        report = dict(report or {'source': job['source'], 'output': job['output'], 'ok': ok, 'error': error},
+                      worker=job['worker'], attempts=job['attempts'])
+        worker = self.workers.get(job['worker'])
+        job.update(lease=None, percent=0.0)
+        if ok:
+            job['state'] = 'done'
+            worker['completed'] += 1
+            self.results.put((index, True, report))
+            return
+        if self.cancelled or interrupted:
+            job['state'] = 'pending'
+            if interrupted and not self.cancelled:
+                job['attempts'] -= 1
+                print(f"Requeued {job['source']}: interrupted on {job['worker']}")
+            return
+        worker['failed'] += 1
+        job['failed_on'].add(job['worker'])
+        if job['attempts'] < self.max_attempts:
+            job['state'] = 'pending'
+            print(f"Retrying {job['source']} (attempt {job['attempts'] + 1}/{self.max_attempts}) "
+                  f"after failure on {job['worker']}: {error or report.get('error') or 'conversion failed'}")
+        else:
+            job['state'] = 'failed'
+            self.results.put((index, False, report))
+
+    # 收回超过租约时长没有续租的章节
+    def expire(self):
+        now = time.monotonic()
+        for lease, index in list(self.leases.items()):
+            if self.jobs[index]['expires'] < now:
+                del self.leases[lease]
+                self.release(index, False, None, f"lease expired on {self.jobs[index]['worker']}")
+
+    # 整体进度（按字节数加权）和估算的已处理页数、字节数，与 run_batch_jobs 的汇总方式相同
+    def overall(self):
+        progress = [100.0 if job['state'] in ('done', 'failed') else job['percent'] for job in self.jobs]
+        bytes_done = sum(p * w for p, w in zip(progress, self.weights)) / 100
+        total_weight = sum(self.weights)
+        return {'percent': bytes_done / total_weight * 100 if total_weight else 100.0,
+                'pages_done': round(sum(p * n for p, n in zip(progress, self.page_counts)) / 100),
+                'pages_total': sum(self.page_counts), 'bytes_done': bytes_done, 'bytes_total': total_weight}
+
+    def status(self):
+        now = time.time()
+        states = [job['state'] for job in self.jobs]
+        return dict(self.overall(), total=len(self.jobs), pending=states.count('pending'),
+                    running=states.count('leased'), done=states.count('done'), failed=states.count('failed'),
+                    cancelled=self.cancelled,
+                    workers={name: {'seconds_since_seen': round(now - worker['last_seen'], 1),
+                                    'completed': worker['completed'], 'failed': worker['failed'],
+                                    'running': sum(self.jobs[index]['worker'] == name
+                                                   for index in self.leases.values())}
+                             for name, worker in self.workers.items()},
+                    running_jobs=[{'source': self.jobs[index]['source'], 'worker': self.jobs[index]['worker'],
+                                   'percent': round(self.jobs[index]['percent'], 1),
+                                   'attempt': self.jobs[index]['attempts']}
+                                  for index in self.leases.values()])
+
+    # 在 address 上提供HTTP接口，直到全部章节结束（或取消后正在转换的章节都已停止），返回 (成功数, 失败数)
+    # 每个章节的最终结果在调用线程中交给 on_job_done(任务序号, 是否成功, 运行报告)，运行报告中加入了节点名和尝试次数
+    def run(self, address=('127.0.0.1', CLUSTER_PORT), progress_callback=None, on_job_done=None, cancel_event=None):
+        import socket
+        from http.server import ThreadingHTTPServer
+        
+        if not self.token and not is_loopback_host(address[0]):
+            raise ValueError(CLUSTER_TOKEN_REQUIRED)
+        server = ThreadingHTTPServer(address, _cluster_handler())
+        server.daemon_threads = True
+        server.coordinator = self
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address[:2]
+        print(f"Coordinator listening on http://{socket.gethostname() if host in ('', '0.0.0.0') else host}:{port}")
+        success_count = 0
+        fail_count = 0
+        try:
+            while True:
+                with self.lock:
+                    if cancel_event is not None and cancel_event.is_set():
+                        self.cancelled = True
+                    self.expire()
+                    finished = self.finished()
+                    overall = self.overall()
+                    running_nodes = {self.jobs[index]['worker'] for index in self.leases.values()}
+                    done_count = sum(job['state'] in ('done', 'failed') for job in self.jobs)
+                
+                while True:
+                    try:
+                        index, ok, report = self.results.get_nowait()
+                    except queue.Empty:
+                        break
+                    if ok:
+                        success_count += 1
+                    else:
+                        fail_count += 1
+                    if on_job_done:
+                        on_job_done(index, ok, report)
+                
+                if progress_callback:
+                    if self.cancelled:
+                        status = "正在取消，等待工作节点停止..."
+                    else:
+                        status = (f"{done_count}/{len(self.jobs)} 个章节已完成，"
+                                  f"{len(self.leases)} 个正在 {len(running_nodes)} 个节点上转换")
+                    report_progress(progress_callback, overall.pop('percent'), status, **overall)
+                if finished:
+                    break
+                time.sleep(0.1)
+            
+            # 让仍在轮询的节点得知任务已经结束后再关闭服务，它们随后自行退出；最近一个租约时长内没有联系过的节点不再等待
+            deadline = time.monotonic() + 2 * CLUSTER_POLL_INTERVAL + 1
+            while time.monotonic() < deadline:
+                with self.lock:
+                    if all(worker['stopped'] or time.time() - worker['last_seen'] > self.lease_seconds
+                           for worker in self.workers.values()):
+                        break
+                time.sleep(0.1)
+        finally:
+            server.shutdown()
+            server.server_close()
+        return (success_count, fail_count)
+
+# 协调器的HTTP请求处理：请求和响应都是JSON
+# 处理类在启动协调器时才定义，http.server 不在导入本模块时加载
+def _cluster_handler():
+    from http.server import BaseHTTPRequestHandler
+    
+    class ClusterHandler(BaseHTTPRequestHandler):
+        def reply(self, code, body):
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            coordinator = self.server.coordinator
+            if not coordinator.authorized(self.headers.get('Authorization')):
+                return self.reply(403, {'error': 'forbidden'})
+            if self.path != '/status':
+                return self.reply(404, {'error': 'not found'})
+            with coordinator.lock:
+                self.reply(200, coordinator.status())
+
+        def do_POST(self):
+            coordinator = self.server.coordinator
+            if not coordinator.authorized(self.headers.get('Authorization')):
+                return self.reply(403, {'error': 'forbidden'})
+            handler = {'/lease': coordinator.lease, '/heartbeat': coordinator.heartbeat,
+                       '/complete': coordinator.complete}.get(self.path)
+            if handler is None:
+                return self.reply(404, {'error': 'not found'})
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            except ValueError:
+                return self.reply(400, {'error': 'invalid request'})
+            with coordinator.lock:
+                response = handler(request)
+            self.reply(200, response)
+
+        # 不在标准错误输出中逐条记录请求
+        def log_message(self, format, *args):
+            pass
+    
+    return ClusterHandler
+
+# 用分布式模式转换批量任务：在 address 上启动协调器，由工作节点转换全部章节，返回 (成功数, 失败数)
+# jobs、progress_callback、on_job_done、cancel_event、convert_options、infos 的含义与 run_batch_jobs 相同；
+# 并行数和内存预算由各个工作节点自己决定
+def run_cluster_jobs(jobs, progress_callback=None, on_job_done=None, cancel_event=None, convert_options=None,
+                     infos=None, address=('127.0.0.1', CLUSTER_PORT), lease_seconds=CLUSTER_LEASE_SECONDS,
+                     max_attempts=CLUSTER_MAX_ATTEMPTS, token=None):
+    coordinator = ClusterCoordinator(jobs, infos, convert_options, lease_seconds, max_attempts, token)
+    return coordinator.run(address, progress_callback, on_job_done, cancel_event)
+
+# 分布式模式的工作节点：向协调器申请章节，用本机的工作进程池转换，定期发送心跳报告进度，完成后报告结果
+# 1. workers 和 memory_budget 只限制本机，含义与批量模式相同；申请章节时告诉协调器本机还剩多少内存预算
+# 2. 协调器的全部任务结束或被取消时停止；联系不上协调器超过一个租约时长时也停止（章节会由协调器交给其他节点）；
+#    还没有联系上协调器时一直等待，可以先启动工作节点
+# 3. 租约已经失效（协调器认为本节点超时）的章节仍会转换完，但结果会被忽略；
+#    输出先写临时文件再改名，两个节点同时写同一个章节也不会留下损坏的PDF
+# 4. 工作进程意外退出（如被系统杀掉）时，进程池中的章节都报告为失败，由协调器重试，然后重新创建进程池
+class ClusterWorker:
+    def __init__(self, url, workers=None, memory_budget=None, token=None, name=None, cancel_event=None, log=None):
+        import socket
+        
+        self.url = (url if '://' in url else f"http://{url}").rstrip('/')
+        self.workers = max(1, workers or BATCH_WORKERS or os.cpu_count() or 1)
+        self.memory_budget = memory_budget if memory_budget is not None else default_memory_budget()
+        self.token = token
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.cancel_event = cancel_event or threading.Event()
+        self.log = log or (lambda message: None)
+        self.lease_seconds = CLUSTER_LEASE_SECONDS
+        self.running = {}     # Future -> (租约, 估计内存, 任务序号)
+        self.progress = {}    # 任务序号 -> 百分比
+        self.outbox = []      # 还没有送达协调器的结果
+        self.job_count = 0
+        self.completed = 0
+        self.failed = 0
+        self.last_contact = None
+        self.stopping = False
+        self.broken = False
+
+    # 向协调器发送一个请求，返回响应；联系不上时返回None
+    def contact(self, path, payload):
+        import urllib.error
+        import urllib.request
+        
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        request = urllib.request.Request(self.url + path, json.dumps(dict(payload, worker=self.name)).encode('utf-8'),
+                                         headers)
+        try:
+            with urllib.request.urlopen(request, timeout=CLUSTER_REQUEST_TIMEOUT) as response:
+                result = json.load(response)
+        except urllib.error.HTTPError as e:
+            self.log(f"协调器拒绝了请求（HTTP {e.code}），停止")
+            self.stopping = True
+            return None
+        except (OSError, ValueError):
+            if self.last_contact is not None and time.monotonic() - self.last_contact > self.lease_seconds:
+                self.log(f"超过 {self.lease_seconds:.0f} 秒联系不上协调器，停止")
+                self.stopping = True
+            return None
+        self.last_contact = time.monotonic()
+        return result
+
+    # 在工作进程数和本机内存预算允许的范围内申请章节并提交给进程池
+    def lease_jobs(self, pool):
+        share = self.memory_budget // self.workers if self.memory_budget else None
+        while len(self.running) < self.workers and not self.stopping:
+            in_flight = sum(estimate for _, estimate, _ in self.running.values())
+            response = self.contact('/lease', {'memory': self.memory_budget - in_flight if self.memory_budget else None,
+                                               'idle': not self.running})
+            if response is None:
+                break
+            if response.get('stop'):
+                self.stopping = True
+                break
+            job = response.get('job')
+            if not job:
+                break
+            self.lease_seconds = response['lease_seconds']
+            info = scan_source(job['source'], dimensions=True)
+            page_workers = choose_page_workers(info, max(1, (os.cpu_count() or 1) // self.workers), share)
+            self.job_count += 1
+            try:
+                future = pool.submit(_run_batch_job, self.job_count, job['source'], job['output'], page_workers,
+                                     response['convert_options'])
+            except BrokenProcessPool:
+                self.broken = True
+                self.outbox.append({'lease': job['lease'], 'ok': False, 'interrupted': True})
+                break
+            self.running[future] = (job, estimate_job_memory(info, page_workers), self.job_count)
+            self.log(f"开始: {os.path.basename(job['source'])}（第 {job['attempt']} 次尝试）")
+
+    def heartbeat(self):
+        leases = [{'lease': job['lease'], 'percent': self.progress.get(index, 0)}
+                  for job, _, index in self.running.values()]
+        response = self.contact('/heartbeat', {'leases': leases})
+        if response is None:
+            return
+        lost = set(response.get('lost', ()))
+        for job, _, _ in self.running.values():
+            if job['lease'] in lost and not job.get('lost'):
+                job['lost'] = True
+                self.log(f"租约已失效: {os.path.basename(job['source'])}，结果将被忽略")
+        if response.get('cancel') and not self.stopping:
+            self.log("协调器取消了任务，等待正在转换的章节停止")
+            self.stopping = True
+
+    def finish(self, future):
+        job, _, index = self.running.pop(future)
+        self.progress.pop(index, None)
+        error = None
+        try:
+            ok, report = future.result()
+        except Exception as e:
+            print(f"Error converting {job['source']}: {e}")
+            ok, report, error = False, None, str(e) or type(e).__name__
+            self.broken = self.broken or isinstance(e, BrokenProcessPool)
+        # 本节点停止时中断的章节告诉协调器不计入尝试次数
+        interrupted = not ok and self.stopping
+        if ok:
+            self.completed += 1
+        elif not interrupted:
+            self.failed += 1
+        self.log(f"{'完成' if ok else '中断' if interrupted else '失败'}: {os.path.basename(job['source'])}")
+        self.outbox.append({'lease': job['lease'], 'ok': ok, 'report': report, 'error': error,
+                            'interrupted': interrupted})
+
+    # 把结果按完成顺序送达协调器；联系不上时留到下次
+    def flush(self):
+        while self.outbox and self.contact('/complete', self.outbox[0]) is not None:
+            self.outbox.pop(0)
+
+    def run(self):
+        self.log(f"工作节点 {self.name}：{self.workers} 个工作进程，协调器 {self.url}")
+        # 与批量模式相同，工作进程统一用spawn启动，通过取消事件停止
+        ctx = multiprocessing.get_context('spawn')
+        progress_queue = ctx.Queue()
+        next_heartbeat = 0.0
+        while not self.stopping:
+            worker_cancel_event = ctx.Event()
+            self.broken = False
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx, initializer=_init_batch_worker,
+                                     initargs=(progress_queue, worker_cancel_event)) as pool:
+                while self.running or not (self.stopping or self.broken):
+                    if self.cancel_event.is_set():
+                        self.stopping = True
+                    if self.stopping:
+                        worker_cancel_event.set()
+                    elif not self.broken:
+                        self.lease_jobs(pool)
+                    
+                    done = ()
+                    if self.running:
+                        done, _ = wait(self.running, timeout=CLUSTER_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                    elif not self.stopping:
+                        self.cancel_event.wait(CLUSTER_POLL_INTERVAL)
+                    
+                    while True:
+                        try:
+                            index, p, _ = progress_queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if any(index == running_index for _, _, running_index in self.running.values()):
+                            self.progress[index] = p
+                    for future in done:
+                        self.finish(future)
+                    if self.running and time.monotonic() >= next_heartbeat:
+                        self.heartbeat()
+                        next_heartbeat = time.monotonic() + self.lease_seconds / 3
+                    self.flush()
+            if self.broken and not self.stopping:
+                self.log("工作进程意外退出，重新创建进程池")
+        self.flush()
+        self.log(f"已停止：完成 {self.completed} 个，失败 {self.failed} 个")
+
 # 在后台线程中执行任务
-def run_in_thread(root, func, args=(), on_complete=None):
+# cancellable=True 时，关闭进度窗口会请求取消任务：func 需要接受 cancel_event 参数并在合适的位置停止
+def run_in_thread(root, func, args=(), on_complete=None, kwargs=None, cancellable=False):
+    from tkinter import messagebox
+    
     progress_window, progress_bar, status_label, percent_label = create_progress_window(root)
+    kwargs = dict(kwargs or {})
     
-    def update_progress(value, status_text):
-        # 在主线程中更新UI
-        root.after(0, lambda: progress_bar.configure(value=value))
-        root.after(0, lambda: status_label.configure(text=status_text))
-        root.after(0, lambda: percent_label.configure(text=f"{int(value)}%"))
+    # 取消状态挂在进度窗口上，完成回调据此区分“取消”和“失败”
+    cancel_event = threading.Event()
+    progress_window.cancel_event = cancel_event
+    if cancellable:
+        kwargs['cancel_event'] = cancel_event
+        
+        def request_cancel():
+            if not cancel_event.is_set() and messagebox.askyesno(
+                    "取消任务", "确定要取消当前任务吗？已经完成的文件会保留。", parent=progress_window):
+                cancel_event.set()
+                slot.cancel("正在取消，等待当前页面处理完成...")
+        
+        progress_window.protocol("WM_DELETE_WINDOW", request_cancel)
+    
+    # 工作线程只写入进度槽；主线程按 PROGRESS_POLL_HZ 读取最新进度并刷新界面
+    slot = ProgressSlot()
+    finished = threading.Event()
+    
+    def poll_progress():
+        if not progress_window.winfo_exists():
+            return
+        done = finished.is_set()  # 先读完成标志：任务的最后一次进度在设置标志之前写入，下面一定能取到
+        snapshot = slot.poll()
+        if snapshot:
+            progress_bar.configure(value=snapshot.percent)
+            status_label.configure(text=snapshot.stage)
+            percent_label.configure(text=format_progress_snapshot(snapshot))
+        if not done:
+            progress_window.after(1000 // PROGRESS_POLL_HZ, poll_progress)
     
     def thread_func():
-        result = func(*args, progress_callback=update_progress)
+        try:
+            result = func(*args, progress_callback=slot.post, **kwargs)
+        finally:
+            finished.set()
         
         # 任务完成后在主线程中执行回调
         if on_complete:
             root.after(1000, lambda: on_complete(result))  # 延迟1秒关闭进度窗口
     
+    poll_progress()
+    
     # 启动线程
     thread = threading.Thread(target=thread_func)
     thread.daemon = True
@@ -251,6 +2837,8 @@ def run_in_thread(root, func, args=(), on_complete=None):
 
 # 单文件夹模式
 def single_folder_mode():
+    from tkinter import filedialog
+    
     folder_selected = filedialog.askdirectory(title="选择包含图片的文件夹")
     if folder_selected:
         output_pdf = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF files", "*.pdf")])
@@ -259,6 +2847,7 @@ def single_folder_mode():
                 root,
                 images_to_pdf,
                 args=(folder_selected, output_pdf),
+                cancellable=True,
                 on_complete=lambda result: complete_task(progress_window, result, 
                                                       success_msg=f"PDF创建成功: {os.path.basename(output_pdf)}",
                                                       error_msg="创建PDF失败，文件夹中没有找到图片文件")
@@ -266,6 +2855,8 @@ def single_folder_mode():
 
 # ZIP文件模式
 def zip_file_mode():
+    from tkinter import filedialog
+    
     zip_file = filedialog.askopenfilename(filetypes=[("ZIP files", "*.zip")])
     if zip_file:
         output_pdf = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF files", "*.pdf")])
@@ -274,6 +2865,7 @@ def zip_file_mode():
                 root,
                 images_to_pdf,
                 args=(zip_file, output_pdf),
+                cancellable=True,
                 on_complete=lambda result: complete_task(progress_window, result,
                                                       success_msg=f"ZIP文件中的图片已成功转换为PDF: {os.path.basename(output_pdf)}",
                                                       error_msg="ZIP文件中没有找到图片文件")
@@ -281,121 +2873,45 @@ def zip_file_mode():
 
 # ZIP批量模式
 def batch_zip_mode():
+    from tkinter import filedialog
+    
     zip_files = filedialog.askopenfilenames(title="选择多个ZIP文件", filetypes=[("ZIP files", "*.zip")])
     if zip_files:
         output_folder = filedialog.askdirectory(title="选择PDF输出文件夹")
         if output_folder:
-            # 创建一个处理所有ZIP文件的函数
-            def process_all_zips(progress_callback=None):
-                success_count = 0
-                fail_count = 0
-                total_files = len(zip_files)
-                
-                for i, zip_file in enumerate(zip_files):
-                    # 更新总体进度
-                    if progress_callback:
-                        overall_progress = (i / total_files) * 100
-                        progress_callback(overall_progress, f"处理ZIP文件 {i+1}/{total_files}: {os.path.basename(zip_file)}")
-                    
-                    # 获取ZIP文件名（不含路径和扩展名）
-                    zip_basename = os.path.basename(zip_file)
-                    zip_name = os.path.splitext(zip_basename)[0]
-                    
-                    # 设置输出PDF路径
-                    output_pdf = os.path.join(output_folder, f"{zip_name}.pdf")
-                    
-                    # 为当前ZIP文件创建一个进度回调函数
-                    def zip_progress_callback(p, s):
-                        if progress_callback:
-                            # 计算当前ZIP在整体中的进度比例
-                            file_progress_portion = 1 / total_files
-                            # 当前文件的基础进度百分比
-                            base_progress = (i / total_files) * 100
-                            # 当前文件贡献的进度百分比
-                            file_progress = p * file_progress_portion
-                            # 总进度
-                            overall_progress = base_progress + file_progress
-                            progress_callback(overall_progress, f"[{i+1}/{total_files}] {s}")
-                    
-                    # 处理ZIP文件
-                    if images_to_pdf(zip_file, output_pdf, progress_callback=zip_progress_callback):
-                        success_count += 1
-                    else:
-                        fail_count += 1
-                
-                if progress_callback:
-                    progress_callback(100, f"处理完成: 成功 {success_count} 个, 失败 {fail_count} 个")
-                
-                return (success_count, fail_count)
-            
             # 在后台线程中处理所有ZIP文件
             progress_window = run_in_thread(
                 root,
                 process_all_zips,
+                args=(zip_files, output_folder),
+                kwargs={'resume': ask_resume(output_folder)},
+                cancellable=True,
                 on_complete=lambda result: complete_batch_task(progress_window, result, output_folder)
             )
 
 # 批量模式
 def batch_mode():
+    from tkinter import filedialog
+    
     root_folder = filedialog.askdirectory(title="选择包含多个漫画文件夹的主文件夹")
     if root_folder:
         output_folder = os.path.join(root_folder, "PDF输出")
         os.makedirs(output_folder, exist_ok=True)
         
-        # 创建一个处理所有文件夹的函数
-        def process_all_folders(progress_callback=None):
-            subdirs = [d for d in os.listdir(root_folder) if os.path.isdir(os.path.join(root_folder, d))]
-            total_dirs = len(subdirs)
-            
-            if total_dirs == 0:
-                if progress_callback:
-                    progress_callback(100, "没有找到子文件夹")
-                return (0, 0)
-            
-            success_count = 0
-            fail_count = 0
-            
-            for i, subdir in enumerate(subdirs):
-                # 更新总体进度
-                if progress_callback:
-                    overall_progress = (i / total_dirs) * 100
-                    progress_callback(overall_progress, f"处理文件夹 {i+1}/{total_dirs}: {subdir}")
-                
-                subdir_path = os.path.join(root_folder, subdir)
-                output_pdf = os.path.join(output_folder, f"{subdir}.pdf")
-                
-                # 为当前文件夹创建一个进度回调函数
-                def folder_progress_callback(p, s):
-                    if progress_callback:
-                        # 计算当前文件夹在整体中的进度比例
-                        folder_progress_portion = 1 / total_dirs
-                        # 当前文件夹的基础进度百分比
-                        base_progress = (i / total_dirs) * 100
-                        # 当前文件夹贡献的进度百分比
-                        folder_progress = p * folder_progress_portion
-                        # 总进度
-                        overall_progress = base_progress + folder_progress
-                        progress_callback(overall_progress, f"[{i+1}/{total_dirs}] {s}")
-                
-                if images_to_pdf(subdir_path, output_pdf, progress_callback=folder_progress_callback):
-                    success_count += 1
-                else:
-                    fail_count += 1
-            
-            if progress_callback:
-                progress_callback(100, f"处理完成: 成功 {success_count} 个, 失败 {fail_count} 个")
-            
-            return (success_count, fail_count)
-        
         # 在后台线程中处理所有文件夹
         progress_window = run_in_thread(
             root,
             process_all_folders,
+            args=(root_folder, output_folder),
+            kwargs={'resume': ask_resume(output_folder)},
+            cancellable=True,
             on_complete=lambda result: complete_batch_task(progress_window, result, output_folder)
         )
 
 # PDF合并模式
 def merge_pdfs_mode():
+    from tkinter import filedialog
+    
     pdf_files = filedialog.askopenfilenames(filetypes=[("PDF files", "*.pdf")])
     if pdf_files:
         output_pdf = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF files", "*.pdf")])
@@ -409,19 +2925,59 @@ def merge_pdfs_mode():
                                                       error_msg="PDF合并失败")
             )
 
+# 追加章节模式：把新章节追加到已有的PDF末尾，不重写原有内容
+def append_mode():
+    from tkinter import filedialog
+    
+    pdf_path = filedialog.askopenfilename(title="选择要追加章节的PDF文件", filetypes=[("PDF files", "*.pdf")])
+    if pdf_path:
+        sources = filedialog.askopenfilenames(title="选择要追加的章节（PDF或ZIP文件）",
+                                              filetypes=[("PDF/ZIP files", "*.pdf *.zip"), ("PDF files", "*.pdf"),
+                                                         ("ZIP files", "*.zip")])
+        if sources:
+            progress_window = run_in_thread(
+                root,
+                append_to_pdf,
+                args=(pdf_path, sources),
+                cancellable=True,
+                on_complete=lambda result: complete_task(progress_window, result,
+                                                      success_msg=f"章节追加成功: {os.path.basename(pdf_path)}",
+                                                      error_msg="追加章节失败，原PDF未被修改")
+            )
+
+# 输出文件夹中有未完成的批量任务时，询问是否跳过已完成的章节继续处理
+def ask_resume(output_folder):
+    from tkinter import messagebox
+    
+    if not has_unfinished_batch(output_folder):
+        return False
+    return messagebox.askyesno("继续上次的任务", "检测到上次未完成的批量任务，是否跳过已完成的章节继续处理？\n"
+                                                 "选择“否”将重新处理所有章节。")
+
 # 任务完成后的处理
 def complete_task(progress_window, result, success_msg, error_msg):
+    from tkinter import messagebox
+    
+    cancelled = progress_window.cancel_event.is_set()
     progress_window.destroy()
     if result:
         messagebox.showinfo("成功", success_msg)
+    elif cancelled:
+        messagebox.showinfo("已取消", "任务已取消")
     else:
         messagebox.showerror("错误", error_msg)
 
 # 批量任务完成后的处理
 def complete_batch_task(progress_window, result, output_folder):
+    from tkinter import messagebox
+    
+    cancelled = progress_window.cancel_event.is_set()
     progress_window.destroy()
     success_count, fail_count = result
-    if success_count > 0:
+    if cancelled:
+        messagebox.showinfo("已取消", f"任务已取消，已完成 {success_count} 个PDF文件在: {output_folder}\n"
+                                     "下次选择同一输出文件夹时可以继续处理剩余章节")
+    elif success_count > 0:
         messagebox.showinfo("成功", f"成功创建 {success_count} 个PDF文件在: {output_folder}" + 
                           (f"\n{fail_count} 个处理失败" if fail_count > 0 else ""))
     else:
@@ -429,6 +2985,8 @@ def complete_batch_task(progress_window, result, output_folder):
 
 # 创建GUI
 def create_gui():
+    import tkinter as tk
+    
     global root
     root = tk.Tk()
     root.title("漫画图片整合成PDF工具【老谢专用】")
@@ -448,7 +3006,7 @@ def create_gui():
 2. ZIP文件模式：
    - 选择包含图片的单个ZIP文件
    - 选择PDF保存位置
-   - 程序将提取ZIP中的图片并按文件名数字顺序合并
+   - 程序将直接读取ZIP中的图片并按文件名数字顺序合并
    - 生成单个PDF文件
 
 3. ZIP批量模式：
@@ -468,11 +3026,16 @@ def create_gui():
    - 选择合并后的PDF保存位置
    - 程序将按选择顺序合并PDF文件
 
+6. 追加章节模式：
+   - 选择已有的PDF文件（例如整部作品的合集）
+   - 选择要追加的新章节（PDF或ZIP文件）
+   - 新章节追加到PDF末尾并生成书签，原有内容不会被重写
+
 注意事项：
 - 支持的图片格式：PNG、JPG、JPEG、WEBP、GIF、BMP
 - 图片会按文件名中的数字顺序排序
 - 请确保文件名中包含数字序号
-- ZIP文件必须直接包含图片文件，不支持嵌套文件夹
+- ZIP文件中的图片可以放在子文件夹中，按文件夹和文件名顺序排列
 - 所有操作都会显示进度条，方便跟踪处理进度
 
 版本：2
@@ -567,9 +3130,300 @@ def create_gui():
                            bg='#FF9800',
                            fg='black',
                            **button_style)
-    merge_button.pack()
+    merge_button.pack(side=tk.LEFT, padx=15)
+    
+    # 添加追加章节按钮
+    append_button = tk.Button(third_row_frame,
+                            text="追加章节模式",
+                            command=append_mode,
+                            bg='#009688',
+                            fg='black',
+                            **button_style)
+    append_button.pack(side=tk.LEFT, padx=15)
     
     root.mainloop()
 
-# 运行GUI
-create_gui()
+# 命令行进度输出：只在整数百分比变化时（以及100%的结束消息）打印一行，适合写入日志
+def make_cli_progress(quiet=False):
+    last_percent = [-1]
+    
+    def progress_callback(p, s):
+        if quiet or (int(p) == last_percent[0] and p < 100):
+            return
+        last_percent[0] = int(p)
+        print(f"[{int(p):3d}%] {s}", file=sys.stderr, flush=True)
+    
+    return progress_callback
+
+# 构建命令行参数解析器
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        prog="img_2_pdf_2.py",
+        description="把漫画图片整合成PDF。不带任何参数运行时打开图形界面。",
+    )
+    parser.add_argument('-q', '--quiet', action='store_true', help="不输出进度信息")
+    subparsers = parser.add_subparsers(dest='command', metavar='命令')
+    
+    # 重复页面和垃圾页面的处理（图片转PDF和合并PDF都适用）
+    dedupe_options = argparse.ArgumentParser(add_help=False)
+    dedupe_options.add_argument('--no-dedupe', dest='dedupe', action='store_false',
+                                help="不识别重复的页面图片，每一页都单独保存")
+    dedupe_options.add_argument('--junk', action='append', default=None, metavar='PATH',
+                                help="已知的垃圾页面图片（文件或文件夹，可多次指定），内容相同的页面会被丢弃")
+    
+    # 运行报告和性能分析（所有命令都适用）
+    report_options = argparse.ArgumentParser(add_help=False)
+    report_options.add_argument('--report', default=None, metavar='JSON',
+                                help="把运行报告（各阶段的耗时、页数、读写字节数、峰值内存）写入该JSON文件")
+    report_options.add_argument('--profile', default=None, metavar='PATH',
+                                help="用cProfile分析本次运行并把结果保存到该文件（可用 python -m pstats 查看）；"
+                                     "分析期间所有页面和章节都在主线程中依次处理")
+    
+    # 图片转PDF的公共参数（单个章节、批量和监视模式都适用）
+    convert_options = argparse.ArgumentParser(add_help=False, parents=[dedupe_options])
+    convert_options.add_argument('--no-jpeg-passthrough', dest='jpeg_passthrough', action='store_false',
+                                 help="JPEG也解码后重新编码，而不是原样嵌入")
+    convert_options.add_argument('--max-width', type=int, default=None, metavar='PX',
+                                 help="把页面缩小到该宽度以内（像素，保持宽高比）")
+    convert_options.add_argument('--max-height', type=int, default=None, metavar='PX',
+                                 help="把页面缩小到该高度以内（像素，保持宽高比）")
+    convert_options.add_argument('--no-gray-detect', dest='detect_gray', action='store_false',
+                                 help="不检测黑白页面，所有重新编码的页面都按彩色保存")
+    convert_options.add_argument('--bitonal', action='store_true',
+                                 help="把纯黑白线稿页面保存为1位黑白图像（体积更小）")
+    convert_options.add_argument('--perceptual-dedupe', action='store_true',
+                                 help="用感知哈希识别重复页面，重新压缩过的相同图片也只保存一次")
+    convert_options.add_argument('--linearize', action='store_true',
+                                 help="输出线性化（快速网页查看）的PDF，阅读器不必下载整个文件就能显示第一页（需要 pikepdf）")
+    convert_options.add_argument('--split-strips', type=float, nargs='?', const=STRIP_PAGE_ASPECT, default=None,
+                                 metavar='ASPECT',
+                                 help=f"把超长条漫切成多个页面，切割点尽量落在留白处；ASPECT 为页面的高宽比"
+                                      f"（默认 {STRIP_PAGE_ASPECT}）")
+    
+    # 单个章节转换的参数
+    single_options = argparse.ArgumentParser(add_help=False, parents=[convert_options, report_options])
+    single_options.add_argument('--page-workers', type=int, default=None,
+                                help="单个章节内并行处理页面的线程数（默认使用全部CPU核心）")
+    single_options.add_argument('--dry-run', action='store_true',
+                                help="只扫描并报告页数、大小和图片尺寸，不转换")
+    
+    # 工作进程池的参数（批量、监视模式和分布式模式的工作节点都适用）
+    pool_options = argparse.ArgumentParser(add_help=False)
+    pool_options.add_argument('-j', '--workers', type=int, default=None,
+                              help="同时转换的章节数（默认使用全部CPU核心）")
+    pool_options.add_argument('--memory-budget', type=int, default=None, metavar='MB',
+                              help="所有工作进程合计的内存预算，单位MB（默认物理内存的一半）")
+    
+    # 分布式模式的公共参数（协调器和工作节点都适用）
+    cluster_options = argparse.ArgumentParser(add_help=False)
+    cluster_options.add_argument('--token', default=None,
+                                 help="分布式模式的共享令牌：协调器只接受带有相同令牌的工作节点")
+    
+    # 批量转换的公共参数
+    batch_options = argparse.ArgumentParser(add_help=False,
+                                            parents=[convert_options, pool_options, report_options, cluster_options])
+    batch_options.add_argument('--incremental', action='store_true',
+                               help="增量模式：跳过自上次转换后没有变化且PDF仍然存在的章节")
+    batch_options.add_argument('--resume', action='store_true',
+                               help="继续上次崩溃或取消的批量任务，跳过断点日志中已完成的章节")
+    batch_options.add_argument('--dry-run', action='store_true',
+                               help="只扫描并报告每个章节的页数、大小、图片尺寸、估计内存以及是否会被跳过，不转换")
+    batch_options.add_argument('--serve', type=parse_address, default=None, metavar='[HOST:]PORT',
+                               help="分布式模式：不在本机转换，而是在该地址上启动协调器，把章节分发给用 worker 命令启动的"
+                                    "工作节点；只给出端口时只监听本机，监听其他地址（如 0.0.0.0:端口）时必须指定 --token；"
+                                    "此时 -j 和 --memory-budget 由各工作节点自己指定")
+    batch_options.add_argument('--lease-seconds', type=float, default=CLUSTER_LEASE_SECONDS, metavar='SECONDS',
+                               help=f"分布式模式：工作节点超过多少秒没有心跳就把它的章节交给其他节点（默认 {CLUSTER_LEASE_SECONDS}）")
+    batch_options.add_argument('--max-attempts', type=int, default=CLUSTER_MAX_ATTEMPTS,
+                               help=f"分布式模式：每个章节最多尝试的次数（默认 {CLUSTER_MAX_ATTEMPTS}）")
+    
+    folder = subparsers.add_parser('folder', parents=[single_options], help="单文件夹模式：把一个文件夹中的图片合并为PDF")
+    folder.add_argument('source', help="包含图片的文件夹")
+    folder.add_argument('output', help="输出PDF路径")
+    
+    zip_parser = subparsers.add_parser('zip', parents=[single_options], help="ZIP文件模式：把一个ZIP中的图片合并为PDF")
+    zip_parser.add_argument('source', help="包含图片的ZIP文件")
+    zip_parser.add_argument('output', help="输出PDF路径")
+    
+    batch_folder = subparsers.add_parser('batch-folder', parents=[batch_options],
+                                         help="批量模式：主文件夹下的每个子文件夹生成一个PDF")
+    batch_folder.add_argument('source', help="包含多个漫画文件夹的主文件夹")
+    batch_folder.add_argument('-o', '--output', default=None, help="PDF输出文件夹（默认为 主文件夹/PDF输出）")
+    
+    batch_zip = subparsers.add_parser('batch-zip', parents=[batch_options], help="ZIP批量模式：每个ZIP生成一个同名PDF")
+    batch_zip.add_argument('sources', nargs='+', help="ZIP文件")
+    batch_zip.add_argument('-o', '--output', required=True, help="PDF输出文件夹")
+    
+    merge = subparsers.add_parser('merge', parents=[dedupe_options, report_options], help="PDF合并模式：按给定顺序合并多个PDF")
+    merge.add_argument('sources', nargs='+', help="要合并的PDF文件")
+    merge.add_argument('-o', '--output', required=True, help="合并后的PDF路径")
+    merge.add_argument('--linearize', action='store_true',
+                       help="输出线性化（快速网页查看）的PDF，阅读器不必下载整个文件就能显示第一页（需要 pikepdf）")
+    
+    append = subparsers.add_parser('append', parents=[convert_options, report_options],
+                                   help="追加章节模式：把章节（PDF、图片文件夹或ZIP）追加到已有PDF的末尾")
+    append.add_argument('target', help="要追加章节的已有PDF")
+    append.add_argument('sources', nargs='+', help="要追加的章节：PDF文件、图片文件夹或ZIP文件")
+    
+    watch = subparsers.add_parser('watch', parents=[convert_options, pool_options],
+                                  help="监视模式：持续监视输入文件夹，新的章节文件夹或ZIP写完后自动转换为PDF")
+    watch.add_argument('inputs', nargs='+', help="要监视的输入文件夹")
+    watch.add_argument('-o', '--output', required=True, help="PDF输出文件夹（持久化队列和增量清单也保存在这里）")
+    watch.add_argument('--interval', type=float, default=WATCH_INTERVAL, metavar='SECONDS',
+                       help=f"扫描输入文件夹的间隔秒数（默认 {WATCH_INTERVAL}）")
+    watch.add_argument('--settle', type=float, default=WATCH_SETTLE_SECONDS, metavar='SECONDS',
+                       help=f"章节的大小和修改时间保持不变多少秒后才开始转换（默认 {WATCH_SETTLE_SECONDS}）")
+    watch.add_argument('--metrics', default=None, metavar='JSON',
+                       help="持续把队列深度、正在运行的任务和延迟统计写入该JSON文件")
+    watch.add_argument('--collect', default=None, metavar='PDF',
+                       help="把每个转换完成的章节追加到这个合集PDF的末尾")
+    
+    worker = subparsers.add_parser('worker', parents=[pool_options, cluster_options],
+                                   help="分布式模式的工作节点：从协调器（batch-folder / batch-zip --serve）领取章节并在本机转换")
+    worker.add_argument('coordinator', help=f"协调器的地址，例如 http://主机名:{CLUSTER_PORT}")
+    worker.add_argument('--name', default=None, help="在协调器状态中显示的节点名（默认为 主机名:进程号）")
+    
+    return parser
+
+# 线性化在每个文件写完之后才进行：没有安装 pikepdf 时在开始任何转换之前就报错退出，而不是每个文件都转换完才失败
+def require_linearize_support():
+    if importlib.util.find_spec('pikepdf') is None:
+        sys.exit(LINEARIZE_REQUIRES_PIKEPDF)
+
+# 从命令行参数中取出传给 images_to_pdf 的转换参数
+def convert_options_from_args(args):
+    options = {'jpeg_passthrough': args.jpeg_passthrough, 'detect_gray': args.detect_gray, 'bitonal': args.bitonal}
+    if args.max_width or args.max_height:
+        options['max_size'] = (args.max_width, args.max_height)
+    # 去重和线性化选项只在不同于默认值时才加入，默认转换的增量清单指纹保持不变
+    if not args.dedupe:
+        options['dedupe'] = False
+    if args.perceptual_dedupe:
+        options['perceptual_dedupe'] = True
+    if args.linearize:
+        require_linearize_support()
+        options['linearize'] = True
+    if args.split_strips:
+        options['strip_aspect'] = args.split_strips
+    if args.junk:
+        # 用排序后的列表而不是集合：转换参数需要能写入JSON清单并传给工作进程
+        options['junk_hashes'] = sorted(load_junk_hashes(args.junk, args.perceptual_dedupe))
+    return options
+
+# 执行一个命令行命令，返回进程退出码
+def run_command(args, progress_callback, cancel_event):
+    if getattr(args, 'dry_run', False):
+        if args.command in ('folder', 'zip'):
+            jobs, output_folder = [(args.source, args.output)], os.path.dirname(os.path.abspath(args.output))
+        elif args.command == 'batch-folder':
+            output_folder = args.output or os.path.join(args.source, "PDF输出")
+            jobs = folder_jobs(args.source, output_folder)
+        else:
+            jobs, output_folder = zip_jobs(args.sources, args.output), args.output
+        plan = plan_batch(jobs, output_folder, getattr(args, 'incremental', False), getattr(args, 'resume', False),
+                          convert_options_from_args(args), dimensions=True)
+        print(format_plan_report(plan))
+        return 0
+    
+    if args.command in ('folder', 'zip'):
+        ok, report = convert_job(args.source, args.output, progress_callback=progress_callback,
+                                 page_workers=args.page_workers, cancel_event=cancel_event,
+                                 **convert_options_from_args(args))
+        if args.report:
+            write_run_report(args.report, report)
+        return 0 if ok else 1
+    
+    if args.command in ('merge', 'append'):
+        stats = RunStats(kind=args.command, sources=args.sources)
+        if args.command == 'merge':
+            if args.linearize:
+                require_linearize_support()
+            junk_hashes = load_junk_hashes(args.junk) if args.junk else None
+            ok = merge_pdfs(args.sources, args.output, progress_callback=progress_callback, dedupe=args.dedupe,
+                            junk_hashes=junk_hashes, linearize=args.linearize, stats=stats)
+        else:
+            ok = append_to_pdf(args.target, args.sources, progress_callback=progress_callback,
+                               convert_options=convert_options_from_args(args), cancel_event=cancel_event,
+                               stats=stats)
+        if args.report:
+            write_run_report(args.report, stats.report(output=getattr(args, 'output', None) or args.target, ok=ok))
+        return 0 if ok else 1
+    
+    memory_budget = args.memory_budget * 1024 * 1024 if args.memory_budget else None
+    if args.command == 'watch':
+        daemon = WatchDaemon(args.inputs, args.output, args.workers, memory_budget, convert_options_from_args(args),
+                             args.interval, args.settle, args.collect, args.metrics, cancel_event,
+                             log=None if args.quiet else lambda message: print(message, file=sys.stderr, flush=True))
+        daemon.run()
+        return 0
+    
+    if args.command == 'worker':
+        worker = ClusterWorker(args.coordinator, args.workers, memory_budget, args.token, args.name, cancel_event,
+                               log=None if args.quiet else lambda message: print(message, file=sys.stderr, flush=True))
+        worker.run()
+        return 0
+    
+    cluster = None
+    if args.serve:
+        if not args.token and not is_loopback_host(args.serve[0]):
+            sys.exit(CLUSTER_TOKEN_REQUIRED)
+        cluster = {'address': args.serve, 'lease_seconds': args.lease_seconds, 'max_attempts': args.max_attempts,
+                   'token': args.token}
+    if args.command == 'batch-folder':
+        output_folder = args.output or os.path.join(args.source, "PDF输出")
+        os.makedirs(output_folder, exist_ok=True)
+        success_count, fail_count = process_all_folders(args.source, output_folder, progress_callback,
+                                                        args.workers, memory_budget, args.incremental,
+                                                        args.resume, cancel_event, convert_options_from_args(args),
+                                                        args.report, cluster)
+    else:
+        os.makedirs(args.output, exist_ok=True)
+        success_count, fail_count = process_all_zips(args.sources, args.output, progress_callback,
+                                                     args.workers, memory_budget, args.incremental,
+                                                     args.resume, cancel_event, convert_options_from_args(args),
+                                                     args.report, cluster)
+    
+    print(f"成功 {success_count} 个, 失败 {fail_count} 个")
+    return 0 if success_count and not fail_count and not cancel_event.is_set() else 1
+
+# 命令行入口，返回进程退出码；没有指定命令时打开图形界面
+def main(argv=None):
+    global PAGE_WORKERS
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    
+    if args.command is None:
+        create_gui()
+        return 0
+    
+    progress_callback = make_cli_progress(args.quiet)
+    
+    # 第一次 Ctrl+C 请求取消（已完成的文件保留，批量任务可以用 --resume 继续），第二次立即退出
+    cancel_event = threading.Event()
+    
+    def handle_sigint(signum, frame):
+        if cancel_event.is_set():
+            raise KeyboardInterrupt
+        cancel_event.set()
+        print("正在取消，再按一次 Ctrl+C 立即退出", file=sys.stderr, flush=True)
+    
+    signal.signal(signal.SIGINT, handle_sigint)
+    
+    if not getattr(args, 'profile', None):
+        return run_command(args, progress_callback, cancel_event)
+    
+    # cProfile 只记录启用它的线程：分析时不使用页面线程和工作进程，全部工作都在主线程中完成
+    import cProfile
+    PAGE_WORKERS = 1
+    for option in ('page_workers', 'workers'):
+        if hasattr(args, option):
+            setattr(args, option, 1)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(run_command, args, progress_callback, cancel_event)
+    finally:
+        profiler.dump_stats(args.profile)
+
+# 作为模块导入时不做任何事；直接运行时进入命令行或图形界面
+if __name__ == "__main__":
+    sys.exit(main())